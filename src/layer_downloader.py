@@ -1,25 +1,11 @@
 import os
 import sys
+import argparse
 import logging
-from layers.road_sub1_class import OSMRoadDataDownloader
-from layers.railway_sub3_class import OSMRailwayDataDownloader
-from layers.dam_sub5_class import OSMDamDataDownloader
-from layers.school_sub6_class import OSMSchoolDataDownloader
-from layers.uni_sub7_class import OSMEducationDataDownloader
-from layers.ferry_sub8_class import OSMFerryTerminalDataDownloader
-from layers.ferry_sub9_class import OSMFerryRouteDataDownloader
-from layers.port_sub10_class import OSMPortDataDownloader
-from layers.bank_sub11_class import OSMBankDataDownloader
-from layers.atm_sub12_class import OSMATMDataDownloader
-from layers.health_fac_sub13_class import OSMHealthDataDownloader
-from layers.hosp_sub14_class import OSMHospitalDataDownloader
-from layers.border_control_sub18_class import OSMBorderControlDataDownloader
-from layers.settlement_sub19_class import OSMSettlementsDataDownloader
-from layers.waterbodies_sub27_class import OSMLakeDataDownloader
-from layers.large_river_sub28_class import OSMLargeRiverDataDownloader
-from layers.phy_river_sub29_class import OSMRiverDataDownloader
-from layers.canal_sub30_class import OSMCanalDataDownloader
-from layers.rail2_sub31_class import OSMRailwayStationDataDownloader
+from runner.checkpoint import Checkpoint
+from runner import profiling, worker
+from runner.history import RunHistory
+from layers import registry
 
 # function 'get_crs_project' that takes a country code as input and returns the corresponding
 # coordinate Reference System (CRS) code. CRS codes are used to translate between geographic locations
@@ -35,8 +21,8 @@ def get_crs_project(country_code):
     }
     return crs_mapping.get(country_code.lower(), 4326)
 
-# Define a function 'process_geojson_file' that takes the path of a geojson file as input.
-def process_geojson_file(geojson_path, layer):
+# Define a function 'create_downloader' that returns the downloader instance of one layer for a geojson file.
+def create_downloader(geojson_path, layer):
     # Extract the country code from the filename of the geojson file. This assumes the file is named using the country code.
     country_code = os.path.basename(geojson_path).split('.')[0]
     # Call 'get_crs_project' function with the extracted country code to get the appropriate CRS code for the country.
@@ -44,32 +30,13 @@ def process_geojson_file(geojson_path, layer):
     # Define a variable 'crs_global' with a value of 4326, representing the global CRS code (WGS 84).
     crs_global = 4326
 
-    # Initialisee a list 'downloaders' with instances of various data downloader classes,
-    # each initialised with parameters like the geojson path, country code, and CRS codes.
-    # These instances are responsible for downloading and processing specific types of geographic data.
-    downloaders = {
-        "1": OSMRoadDataDownloader(geojson_path, country_code),
-        "2": OSMRailwayDataDownloader(geojson_path, country_code),
-        "3": OSMDamDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "4": OSMSchoolDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "5": OSMEducationDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "6": OSMFerryTerminalDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "7": OSMFerryRouteDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "8": OSMPortDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "9": OSMBankDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "10": OSMATMDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "11": OSMHealthDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "12": OSMHospitalDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "13": OSMBorderControlDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "14": OSMSettlementsDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "15": OSMLakeDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "16": OSMLargeRiverDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "17": OSMRiverDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "18": OSMCanalDataDownloader(geojson_path, crs_project, crs_global, country_code),
-        "19": OSMRailwayStationDataDownloader(geojson_path, crs_project, crs_global, country_code),
-    }
+    # Only the requested layer's module is imported and only its downloader is constructed.
+    # Layers are looked up in the registry, which also holds layers installed through entry points.
+    return registry.create_layer(layer, geojson_path, country_code, crs_project, crs_global)
 
-    downloader = downloaders[layer]
+# Define a function 'process_geojson_file' that takes the path of a geojson file as input.
+def process_geojson_file(geojson_path, layer):
+    downloader = create_downloader(geojson_path, layer)
     if downloader:
         try:
             # Attempt to download and process the data using the 'download_and_process_data' method of the downloader instance.
@@ -80,29 +47,181 @@ def process_geojson_file(geojson_path, layer):
             # If an error occurs during the download or processing, log an error message with the class name of the downloader and the error message.
             logging.error(f"Error in {downloader.__class__.__name__}: {e}")
 
-# The 'main' function, which serves as the entry point for the script execution.
-def main(geojson_dir):
-    
-    geojson_files = [os.path.join(geojson_dir, f) for f in os.listdir(geojson_dir) if f.endswith(".json")]
-
-    # Instead of using multiprocessing, we use a simple for loop to process each file sequentially.
-    for geojson_file in geojson_files:
+# Yield a (job, downloader) pair per (geojson file, layer) job, with the downloader created only when the pipeline asks for it.
+# 'options' are optional processing steps, e.g. {'dissolve': True}, set on the layers that support them.
+# With a 'profilers' dict, every downloader runs under a JobProfiler, stored in it by (country, layer).
+def iter_downloaders(jobs, options=None, profilers=None):
+    for geojson_file, layer in jobs:
         try:
-            # Process each file using the process_geojson_file function.
-            process_geojson_file(geojson_file, layer)
-            logging.info(f"Successfully processed {geojson_file}")
+            downloader = create_downloader(geojson_file, layer)
         except Exception as e:
             logging.error(f"Failed to process {geojson_file}: {e}")
+            continue
+        for name, value in (options or {}).items():
+            if hasattr(downloader, name):
+                setattr(downloader, name, value)
+        if profilers is not None:
+            from runner import scheduling
+            country = scheduling.country_code(geojson_file)
+            profilers[(country, layer)] = profiler = profiling.JobProfiler(country, layer)
+            profiler.attach(downloader)
+        yield (geojson_file, layer), downloader
+
+# The 'main' function, which serves as the entry point for the script execution.
+def main(geojson_dir, layer, extract=None, resume=False, export_tiles=False, dissolve=False, merge_lines=False, profile=False,
+         queue=None, ports_near_water=None):
+    # The pipeline modules pull in pandas, geopandas, shapely and osmnx, so they are only imported
+    # for a run; importing this module (e.g. for '--startup-time') stays cheap
+    from layers.fetch import use_source
+    from runner import scheduling, splitter, tiles
+    from runner.derived import DerivedLayers
+    from runner.executor import run_pipelined
+    from runner.outputs import output_bytes, output_files, remove_outputs
+
+    geojson_files = [os.path.join(geojson_dir, f) for f in os.listdir(geojson_dir) if f.endswith(".json")]
+    layers = registry.layer_keys() if layer == "all" else [layer]
+    jobs = [(geojson_file, key) for geojson_file in geojson_files for key in layers]
+
+    # Finished (country, layer) jobs are journalled with the hashes of their outputs. A resumed run
+    # skips the jobs whose outputs are still in place and unchanged; any other run starts a new journal.
+    checkpoint = Checkpoint()
+    if resume:
+        remaining = [job for job in jobs if not checkpoint.completed((scheduling.country_code(job[0]), job[1]))]
+        logging.info(f"Resuming: {len(jobs) - len(remaining)} of {len(jobs)} jobs already done")
+        jobs = remaining
+        layers = [key for key in layers if any(job[1] == key for job in jobs)]
+    elif queue is None:
+        # Queue workers on several hosts share the working directory and do not journal their jobs
+        checkpoint.clear()
+    if not jobs:
+        return
+
+    # Optional processing steps, switched on for the layers that support them
+    options = {'dissolve': dissolve, 'merge_lines': merge_lines, 'near_water': ports_near_water}
+
+    # Multi-node mode: the first worker started on the queue directory queues the jobs, longest
+    # first, and every worker on any host serves the queue until no job is left queued or running.
+    if queue is not None:
+        history = RunHistory()
+        jobs = scheduling.order_jobs(jobs, history.expected_durations())
+        history.close()
+        worker.seed_queue(queue, jobs, options)
+        worker.serve(queue, drain=True)
+        return
+
+    # Global mode: read the OSM extract, split it into the countries and answer every job's
+    # queries from the split instead of querying Overpass per country and layer.
+    source = None
+    if extract is not None:
+        # With the run's options set, as they can change a layer's queries (e.g. --ports-near-water)
+        recorders = [downloader for _, downloader in iter_downloaders([(geojson_files[0], key) for key in layers], options)]
+        filters, network_types = splitter.record_queries(recorders)
+        source = splitter.split_extract(extract, geojson_files, filters, network_types)
+
+    # Every job's stage durations, feature count, output size, cache hits and failures are
+    # appended to the run history database.
+    history = RunHistory()
+    history.start_run(command=' '.join(sys.argv))
+
+    # Start the jobs expected to take longest first, using the durations recorded by earlier runs. The
+    # jobs run one after another here, so this mainly fixes the order; it pays off on a queue.
+    jobs = scheduling.order_jobs(jobs, history.expected_durations())
+    if source is not None:
+        jobs = scheduling.group_by_country(jobs)
+
+    # Layers derived from another layer of the run (e.g. hospitals from health facilities) are
+    # answered from its data in memory, so their parent is fetched first with a widened query.
+    derived = DerivedLayers(jobs, create_downloader)
+    jobs = derived.order(jobs)
+
+    def record_job(job, downloader, metrics):
+        geojson_file, key = job
+        history.record_job(scheduling.country_code(geojson_file), key, metrics, output_bytes=output_bytes(downloader))
+        checkpoint.record((scheduling.country_code(geojson_file), key), output_files(downloader))
+
+    # A job's outputs are only journalled when this run wrote them
+    def clear_outputs(job, downloader):
+        remove_outputs(downloader)
+
+    def record_failure(job, downloader, stage, error, metrics):
+        geojson_file, key = job
+        history.record_job(scheduling.country_code(geojson_file), key, metrics, status='failed', failed_stage=stage, error=error)
+
+    # With 'profile', each job's stages are profiled and the hottest functions printed after the run
+    profilers = {} if profile else None
+
+    # Jobs run through a fetch / process / write pipeline, so the next job's download overlaps
+    # with the current job's processing and the previous job's write.
+    downloaders = iter_downloaders(jobs, options, profilers)
+    if source is not None:
+        downloaders = source.attach(downloaders)
+    try:
+        with use_source(source):
+            run_pipelined(derived.attach(downloaders), on_complete=record_job, on_error=record_failure, before_write=clear_outputs)
+    finally:
+        history.close()
+        if profilers:
+            print(profiling.summarize([profiler.dump() for profiler in profilers.values()]))
+
+    # Export stage: one vector tileset per country from all of its layers on disk
+    if export_tiles:
+        for country in sorted({scheduling.country_code(geojson_file) for geojson_file, _ in jobs}):
+            try:
+                tiles.export_tiles(os.path.join(tiles.OUTPUT_ROOT, country))
+            except Exception as e:
+                logging.error(f"Tile export of {country} failed: {e}")
+
+
+# Print the import and initialisation cost of the requested layers ('all' for every layer).
+def report_startup_time(layer, geojson_path=None):
+    layers = registry.layer_keys() if layer in (None, "all") else [layer]
+    geojson_path = geojson_path or "startup.json"
+    country_code = os.path.basename(geojson_path).split('.')[0]
+    rows = registry.measure_startup(layers, geojson_path, country_code, get_crs_project(country_code), 4326)
+    print(registry.format_startup_report(rows))
 
 
 if __name__ == "__main__":
 
-    if len(sys.argv) < 2:
-        logging.error("python main.py <geojson_dir> <layer>")
+    parser = argparse.ArgumentParser(usage="python layer_downloader.py <geocint_work_dir> <layer|all>")
+    parser.add_argument("geocint_work_dir", nargs="?")
+    parser.add_argument("layer", nargs="?")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="report per-module import and initialisation time of the selected layers and exit")
+    parser.add_argument("--extract", metavar="PATH",
+                        help="read the OSM data of all countries from this planet or continent extract (.osm.pbf) instead of querying Overpass per country")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the jobs a previous run finished whose outputs still exist and match their recorded hashes")
+    parser.add_argument("--dissolve", action="store_true",
+                        help="merge touching river and lake polygons of the same class and name into single features")
+    parser.add_argument("--merge-lines", action="store_true",
+                        help="join contiguous river and canal segments of the same class and name into continuous lines")
+    parser.add_argument("--ports-near-water", type=float, metavar="METRES",
+                        help="keep industrial areas in the port layer only within this distance of a coastline, harbour or navigable waterway")
+    parser.add_argument("--queue", metavar="DIR",
+                        help="share the jobs with the workers started on other hosts through this queue directory on a shared filesystem")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profile every job and write its pstats and collapsed stacks to {profiling.PROFILE_DIR}")
+    parser.add_argument("--tiles", action="store_true",
+                        help="export each country's layers to a vector tileset (MBTiles) after the run")
+    args = parser.parse_args()
+
+    if args.startup_time:
+        # With a single argument it is taken as the layer, e.g. '--startup-time 1'
+        report_startup_time(args.layer or args.geocint_work_dir)
+    else:
+        if args.layer is None:
+            parser.error("the following arguments are required: geocint_work_dir, layer")
 
-    geocint_work_dir = sys.argv[1]
-    layer = sys.argv[2]
+        if args.queue and args.extract:
+            parser.error("--queue cannot be combined with --extract")
+        # Queue workers run their jobs one by one without the pipeline; profiles and tiles are only made by a direct run
+        if args.queue and args.tiles:
+            parser.error("--queue cannot be combined with --tiles")
+        if args.queue and args.profile:
+            parser.error("--queue cannot be combined with --profile")
 
-    geojson_dir = f"{geocint_work_dir}/geocint/static_data/countries"
+        geojson_dir = f"{args.geocint_work_dir}/geocint/static_data/countries"
 
-    main(geojson_dir)
+        main(geojson_dir, args.layer, extract=args.extract, resume=args.resume, export_tiles=args.tiles, dissolve=args.dissolve,
+             merge_lines=args.merge_lines, profile=args.profile, queue=args.queue, ports_near_water=args.ports_near_water)
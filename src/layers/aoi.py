@@ -0,0 +1,177 @@
+import glob
+import hashlib
+import os
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS
+
+# Country AOIs are parsed and preprocessed once per GeoJSON file and kept in a small parquet file
+# per country (WKB geometries), so every process after the first loads the derived shapes instead
+# of recomputing them. A stored AOI is keyed by a hash of the GeoJSON content and the parameters
+# below, so it is rebuilt only when the source file (or one of the parameters) changes.
+AOI_STORE_DIR = 'data/aoi_store'
+
+# Degrees; the query polygon is grown by this much before it is simplified, so it still covers the AOI
+SIMPLIFY_TOLERANCE = 0.001
+# Metres on either side of the AOI boundary covered by the boundary band
+BAND_WIDTH = 5000
+# Degrees; edge of the square cells of the tiling grid
+TILE_SIZE = 1.0
+# Bump when the way the variants are derived changes, so stored AOIs are rebuilt
+STORE_VERSION = 1
+
+_loaded = {}
+
+
+class AOI:
+    def __init__(self, union, query, interior, boundary, projected, projected_crs, tiles):
+        self.union = union                  # validated union of the GeoJSON's polygons, EPSG:4326
+        self.query = query                  # simplified polygon covering the union, for Overpass queries
+        self.interior = interior            # the union shrunk by BAND_WIDTH
+        self.boundary = boundary            # band of BAND_WIDTH on either side of the AOI boundary
+        self.projected = projected          # the union in 'projected_crs'
+        self.projected_crs = projected_crs
+        self.tiles = tiles                  # grid cells of TILE_SIZE clipped to the query polygon
+
+
+# Polygonal part of a geometry after repairing it; make_valid can turn slivers into lines and points
+def _polygonal(geometry):
+    geometry = shapely.make_valid(geometry)
+    if geometry.geom_type == 'GeometryCollection':
+        geometry = shapely.union_all([g for g in geometry.geoms if g.geom_type in ['Polygon', 'MultiPolygon']])
+    return geometry
+
+
+def _projected_crs(union, crs_project):
+    if crs_project is not None and not CRS.from_user_input(crs_project).is_geographic:
+        return CRS.from_user_input(crs_project)
+    # No metric country CRS known: use the UTM zone of the AOI
+    return gpd.GeoSeries([union], crs=4326).estimate_utm_crs()
+
+
+def _tiling_grid(query):
+    minx, miny, maxx, maxy = query.bounds
+    xs = np.arange(np.floor(minx / TILE_SIZE) * TILE_SIZE, maxx, TILE_SIZE)
+    ys = np.arange(np.floor(miny / TILE_SIZE) * TILE_SIZE, maxy, TILE_SIZE)
+    x, y = [a.ravel() for a in np.meshgrid(xs, ys)]
+    tiles = shapely.intersection(shapely.box(x, y, x + TILE_SIZE, y + TILE_SIZE), query)
+    return list(tiles[~shapely.is_empty(tiles)])
+
+
+def build_aoi(geojson_path, crs_project=None):
+    region_gdf = gpd.read_file(geojson_path).to_crs(4326)
+    union = _polygonal(shapely.union_all(shapely.make_valid(region_gdf.geometry.values)))
+    if union.is_empty or union.geom_type not in ['Polygon', 'MultiPolygon']:
+        raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
+
+    query = union.buffer(SIMPLIFY_TOLERANCE).simplify(SIMPLIFY_TOLERANCE, preserve_topology=True)
+    projected_crs = _projected_crs(union, crs_project)
+    projected = gpd.GeoSeries([union], crs=4326).to_crs(projected_crs).iloc[0]
+    inner, outer = projected.buffer(-BAND_WIDTH), projected.buffer(BAND_WIDTH)
+    interior, boundary = gpd.GeoSeries([inner, outer.difference(inner)], crs=projected_crs).to_crs(4326)
+    return AOI(union, query, interior, boundary, projected, projected_crs, _tiling_grid(query))
+
+
+def _store_key(geojson_path, crs_project):
+    digest = hashlib.sha256()
+    with open(geojson_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr((STORE_VERSION, SIMPLIFY_TOLERANCE, BAND_WIDTH, TILE_SIZE, crs_project)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _write(path, aoi):
+    variants = [('union', aoi.union), ('query', aoi.query), ('interior', aoi.interior), ('boundary', aoi.boundary),
+                ('projected', aoi.projected)] + [('tile', tile) for tile in aoi.tiles]
+    frame = pd.DataFrame({
+        'variant': [name for name, _ in variants],
+        'crs': [aoi.projected_crs.to_string() if name == 'projected' else 'EPSG:4326' for name, _ in variants],
+        'geometry': shapely.to_wkb([geometry for _, geometry in variants]),
+    })
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    frame = pd.read_parquet(path)
+    geometries = shapely.from_wkb(frame['geometry'].to_numpy())
+    variants = dict(zip(frame['variant'], geometries))
+    projected_crs = CRS.from_user_input(frame.loc[frame['variant'] == 'projected', 'crs'].iloc[0])
+    tiles = list(geometries[(frame['variant'] == 'tile').to_numpy()])
+    return AOI(variants['union'], variants['query'], variants['interior'], variants['boundary'],
+               variants['projected'], projected_crs, tiles)
+
+
+# Split a polygon until no part has holes: Overpass query polygons are exterior rings only, so a
+# band with a hole would be queried as its whole exterior. A vertical cut through a hole opens it.
+def _without_holes(polygon):
+    if not polygon.interiors:
+        return [polygon]
+    x = shapely.Polygon(polygon.interiors[0]).representative_point().x
+    minx, miny, maxx, maxy = polygon.bounds
+    halves = shapely.intersection(polygon, [shapely.box(minx, miny, x, maxy), shapely.box(x, miny, maxx, maxy)])
+    parts = shapely.get_parts(halves)
+    return [piece for part in parts if part.geom_type == 'Polygon' and not part.is_empty for piece in _without_holes(part)]
+
+
+# Query polygons covering 'region' (EPSG:4326) within the AOI's query polygon: the region cut along
+# the tiling grid into pieces without holes, each queried on its own. osmnx still queries a piece
+# larger than its maximum query area as its convex hull, so callers clip the results to the region;
+# the grid bounds that hull to one cell.
+def region_tiles(aoi, region):
+    pieces = shapely.get_parts(shapely.intersection(np.array(aoi.tiles, dtype=object), region))
+    pieces = pieces[shapely.get_type_id(pieces) == 3]
+    return [piece for polygon in pieces[~shapely.is_empty(pieces)] for piece in _without_holes(polygon)]
+
+
+# Query polygons covering the band of 'width' metres on either side of the AOI boundary, for layers
+# whose features only occur near the border, so the interior of the country is never scanned. The
+# band reaches into the neighbouring countries: clip the results to 'aoi.union'.
+def boundary_tiles(aoi, width=BAND_WIDTH):
+    if width == BAND_WIDTH:
+        band = aoi.boundary
+    else:
+        inner, outer = aoi.projected.buffer(-width), aoi.projected.buffer(width)
+        band = gpd.GeoSeries([outer.difference(inner)], crs=aoi.projected_crs).to_crs(4326).iloc[0]
+    return region_tiles(aoi, band)
+
+
+# The AOI of a country GeoJSON, from this process's memory, the AOI store, or built and stored.
+# 'crs_project' is the country's projected CRS; when it is missing or geographic, the AOI's UTM zone is used.
+def load_aoi(geojson_path, crs_project=None):
+    # A geographic country CRS (e.g. EPSG:4326 for most countries) means the UTM zone, like no CRS at all
+    if crs_project is not None and CRS.from_user_input(crs_project).is_geographic:
+        crs_project = None
+    stat = os.stat(geojson_path)
+    memo_key = (os.path.abspath(geojson_path), stat.st_mtime_ns, stat.st_size, crs_project)
+    if memo_key in _loaded:
+        return _loaded[memo_key]
+
+    country = os.path.basename(geojson_path).split('.')[0]
+    key = _store_key(geojson_path, crs_project)
+    crs_tag = 'utm' if crs_project is None else str(crs_project).replace(':', '')
+    path = os.path.join(AOI_STORE_DIR, f"{country}-{crs_tag}-{key}.parquet")
+    try:
+        aoi = _read(path)
+    except (OSError, ImportError, ValueError):
+        aoi = build_aoi(geojson_path, crs_project)
+        try:
+            os.makedirs(AOI_STORE_DIR, exist_ok=True)
+            _write(path, aoi)
+        except ImportError:
+            # Without pyarrow the AOI is kept for this process only
+            pass
+        else:
+            # Drop the AOIs stored for earlier versions of this file
+            for stale in glob.glob(os.path.join(AOI_STORE_DIR, f"{glob.escape(country)}-{crs_tag}-*.parquet")):
+                if stale != path:
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+    _loaded[memo_key] = aoi
+    return aoi
@@ -1,38 +1,42 @@
 import os
 import osmnx as ox
-import geopandas as gpd
-import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids
 
 class OSMATMDataDownloader:
+    # Taken from the bank layer's data when it runs too
+    derived_from = '9'
+
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.crs_project = crs_project
         self.crs_global = crs_global
-        self.osm_tags_atm = {'amenity': 'atm'}
-        self.osm_tags_bank_with_atm = {'amenity': 'bank', 'atm': 'yes'}
+        # ATMs, and banks with an ATM; an element matching both is kept once
+        self.osm_filters = [{'amenity': 'atm'}, {'amenity': 'bank', 'atm': 'yes'}]
         self.attributes = ['name', 'name:en', 'name_en','osmid']
         ox.settings.log_console = True
         ox.settings.use_cache = True
         self.output_filename = f"data/out/country_extractions/{country_code}/208_cash/{country_code}_cash_atm_pt_s3_osm_pp_atm.shp"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
     
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
     
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
      
-        gdf_atms = ox.geometries_from_polygon(geometry, tags=self.osm_tags_atm)
-
-
-        gdf_banks_with_atms = ox.geometries_from_polygon(geometry, tags=self.osm_tags_bank_with_atm)
-
-     
-        gdf = gpd.GeoDataFrame(pd.concat([gdf_atms, gdf_banks_with_atms], ignore_index=True))
+        gdf = fetch_centroids(geometry, self.osm_filters)
+        return prune_columns(gdf, self.attributes + ['amenity'])
 
+    def process_data(self, gdf):
       
         gdf = gdf.to_crs(epsg=self.crs_project)
         gdf['geometry'] = gdf.geometry.centroid
@@ -40,6 +44,10 @@ class OSMATMDataDownloader:
 
      
         gdf['fclass'] = gdf['amenity']
+        if 'osmid' in gdf.index.names:
+            # Keep the osmid as a column; the index itself is not written
+            gdf['osmid'] = gdf.index.get_level_values('osmid')
+            gdf = gdf.reset_index(drop=True)
 
       
         list_type_cols = [col for col, dtype in gdf.dtypes.items() if dtype == object]
@@ -56,9 +64,7 @@ class OSMATMDataDownloader:
 
       
         self.ensure_unique_column_names(gdf)
-
-       
-        self.save_data(gdf)
+        return gdf
 
     def ensure_unique_column_names(self, gdf):
        
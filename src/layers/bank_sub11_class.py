@@ -1,6 +1,8 @@
 import os
 import osmnx as ox
-import geopandas as gpd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, tags_to_filters
 
 class OSMBankDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -14,17 +16,23 @@ class OSMBankDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/208_cash/{country_code}_cash_bnk_pt_s0_osm_pp_bank.shp"
      
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
 
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
       
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
       
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        gdf = fetch_centroids(geometry, tags_to_filters(self.osm_tags))
+        return prune_columns(gdf, self.attributes + list(self.osm_tags))
 
+    def process_data(self, gdf):
        
         gdf = gdf.to_crs(epsg=self.crs_project)
         gdf['geometry'] = gdf.geometry.centroid
@@ -52,9 +60,7 @@ class OSMBankDataDownloader:
 
  
         self.ensure_unique_column_names(gdf)
-
-        
-        self.save_data(gdf)
+        return gdf
 
     def ensure_unique_column_names(self, gdf):
       
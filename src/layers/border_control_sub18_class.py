@@ -1,37 +1,54 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import boundary_tiles, load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids_in, tags_to_filters
 
 class OSMBorderControlDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.crs_project = crs_project
         self.crs_global = crs_global
+        self.osm_tags = {'border': 'border_control'}
+        self.attributes = ['name', 'name:en', 'name_en']
+        # Tags that describe the kind of crossing; written with the names and the query tags
+        self.source_tags = ['barrier', 'border_type', 'operator']
+        # Border crossings lie on the border: only this many metres along the AOI boundary are searched
+        self.boundary_band = 5000
         ox.settings.log_console = True
         ox.settings.use_cache = True
         self.output_filename = f"data/out/country_extractions/{country_code}/222_pois/{country_code}_pois_bor_pt_s3_osm_pp_bordercrossing.shp"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
       
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        aoi = load_aoi(self.geojson_path, self.crs_project)
+        geometry = aoi.query
 
       
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
 
-        gdf_border_control = ox.geometries_from_polygon(geometry, tags={'border': 'border_control'})
+        tiles = boundary_tiles(aoi, self.boundary_band)
+        gdf_border_control = fetch_centroids_in(tiles, tags_to_filters(self.osm_tags))
+        # The band reaches into the neighbouring countries, whose crossings belong to their own layers
+        if not gdf_border_control.empty:
+            gdf_border_control = gdf_border_control[gdf_border_control.intersects(aoi.union)]
+        return prune_columns(gdf_border_control, self.attributes + list(self.osm_tags) + self.source_tags)
 
+    def process_data(self, gdf_border_control):
      
         gdf_border_control = self.process_geometries(gdf_border_control)
 
 
         gdf_border_control = self.ensure_unique_column_names(gdf_border_control)
-
- 
-        self.save_data(gdf_border_control)
+        return gdf_border_control
 
     def process_geometries(self, gdf):
         
@@ -61,10 +78,10 @@ class OSMBorderControlDataDownloader:
 
     def save_data(self, gdf):
    
-        os.makedirs(os.path.dirname(OSMBorderControlDataDownloader.output_filename), exist_ok=True)
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
     
         try:
-            gdf.to_file(OSMBorderControlDataDownloader.output_filename, driver='ESRI Shapefile')
+            gdf.to_file(self.output_filename, driver='ESRI Shapefile')
         except Exception as e:
             print(f"An error occurred while saving the GeoDataFrame: {e}")
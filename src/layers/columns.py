@@ -0,0 +1,75 @@
+import geopandas as gpd
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Drop every OSM tag column a layer does not use straight after the fetch.
+# 'geometries_from_polygon' returns one column per tag seen in the AOI, so the
+# frame is usually hundreds of columns wide while a layer only keeps a handful;
+# pruning here means reprojection, list flattening and copies only touch the
+# columns that end up in the output. 'keep' should list the output attributes
+# plus any tag the layer derives 'fclass' or filters from.
+def prune_columns(gdf, keep):
+    keep = set(keep)
+    keep.add(gdf.geometry.name)
+    return gdf.drop(columns=[col for col in gdf.columns if col not in keep])
+
+
+# Object columns with at most this share of distinct values are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+# Hold a layer between fetch and write as a plain DataFrame instead of a GeoDataFrame:
+# low-cardinality tags such as 'fclass', 'amenity' or 'highway' become categoricals,
+# other string tags become Arrow strings and the geometries are packed as WKB into
+# a single Arrow binary buffer. List-valued tags must be flattened before this call.
+# The frame keeps the geometry column's name but not the CRS: a layer keeps 'gdf.crs' itself and
+# passes it to 'to_geodataframe', as pandas does not reliably carry metadata through selections.
+def to_compact(gdf):
+    geometry_name = gdf.geometry.name
+    frame = pd.DataFrame(index=gdf.index)
+    for col in gdf.columns:
+        if col != geometry_name:
+            frame[col] = compact_series(gdf[col])
+    frame[geometry_name] = wkb_series(gdf.geometry)
+    return frame
+
+
+# Geometries as WKB, in a single Arrow binary buffer when pyarrow is available
+def wkb_series(geometries):
+    wkb = geometries.to_wkb()
+    if pa is not None:
+        wkb = pd.Series(pd.arrays.ArrowExtensionArray(pa.array(wkb.to_numpy(), type=pa.binary())), index=geometries.index)
+    return wkb
+
+
+def compact_series(values):
+    if not pd.api.types.is_object_dtype(values) or pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        return values
+    if values.nunique() <= CATEGORY_RATIO * len(values):
+        return values.astype('category')
+    if pa is not None:
+        return values.astype(pd.StringDtype('pyarrow'))
+    return values
+
+
+# Writer boundary: rebuild the GeoDataFrame from a compact frame in 'crs', turning categoricals
+# and Arrow strings back into plain object columns the OGR drivers understand
+def to_geodataframe(frame, crs=None, geometry_name='geometry'):
+    if isinstance(frame, gpd.GeoDataFrame):
+        return frame
+    if crs is None:
+        raise ValueError("The CRS of a compact frame must be given")
+    columns = {}
+    for col in frame.columns:
+        if col == geometry_name:
+            continue
+        values = frame[col]
+        if isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            values = values.astype(object).where(values.notna(), None)
+        columns[col] = values
+    columns[geometry_name] = gpd.GeoSeries.from_wkb(frame[geometry_name].to_numpy(dtype=object), index=frame.index, crs=crs)
+    return gpd.GeoDataFrame(columns, index=frame.index, geometry=geometry_name)[list(frame.columns)]
@@ -1,6 +1,8 @@
 import os
 import osmnx as ox
-import geopandas as gpd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids
 
 class OSMDamDataDownloader:
     # Fixed class attributes
@@ -16,13 +18,20 @@ class OSMDamDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/221_phys/{country_code}_phys_dam_pt_s2_osm_pp_dam.gpkg"
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags={self.osm_key: self.osm_value})
+        gdf = fetch_centroids(geometry, [{self.osm_key: self.osm_value}])
+        return prune_columns(gdf, self.attributes)
+
+    def process_data(self, gdf):
         gdf_projected = gdf.to_crs(epsg=self.crs_project)
         gdf_projected['geometry'] = gdf_projected['geometry'].centroid
         gdf = gdf_projected.to_crs(epsg=self.crs_global)
@@ -34,8 +43,6 @@ class OSMDamDataDownloader:
         if 'fclass' not in gdf.columns:
             gdf['fclass'] = self.osm_value
 
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-
         actual_tags = gdf.columns.intersection(self.attributes)
         missing_tags = set(self.attributes) - set(actual_tags)
         if missing_tags:
@@ -46,8 +53,8 @@ class OSMDamDataDownloader:
         gdf = gdf[columns_to_keep]
 
         # Ensure unique column names for Shapefile format
-        gdf = self.ensure_unique_column_names(gdf)  
-
+        gdf = self.ensure_unique_column_names(gdf)
+        return gdf
 
     def ensure_unique_column_names(self, gdf):
         unique_columns = {}
@@ -59,6 +66,10 @@ class OSMDamDataDownloader:
             else:
                 unique_columns[col_truncated] = 1
             gdf.rename(columns={col: col_truncated}, inplace=True)
+        return gdf
+
+    def save_data(self, gdf):
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
         if not gdf.empty:
             gdf.to_file(self.output_filename, driver='GPKG')
@@ -1,7 +1,9 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, tags_to_filters
 
 class OSMFerryTerminalDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -14,15 +16,21 @@ class OSMFerryTerminalDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/232_tran/{country_code}_tran_fte_pt_s2_osm_pp_ferryterminal.gpkg"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the AOI from the GeoJSON file
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download data from OSM based on the provided tags and the geometry of the AOI
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        gdf = fetch_centroids(geometry, tags_to_filters(self.osm_tags))
+        return prune_columns(gdf, self.attributes)
 
+    def process_data(self, gdf):
         # Convert to the projected CRS to calculate centroids
         gdf_projected = gdf.to_crs(epsg=self.crs_project)
         gdf_projected['geometry'] = gdf_projected['geometry'].centroid
@@ -35,9 +43,6 @@ class OSMFerryTerminalDataDownloader:
         for col in list_type_cols:
             gdf[col] = gdf[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
 
-        # Make directories if they don't exist
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-
         actual_tags = gdf.columns.intersection(self.attributes)
         missing_tags = set(self.attributes) - set(actual_tags)
         if missing_tags:
@@ -47,8 +52,9 @@ class OSMFerryTerminalDataDownloader:
         columns_to_keep = ['geometry'] + list(actual_tags)   
         gdf = gdf[columns_to_keep]
 
-        gdf = self.ensure_unique_column_names(gdf) 
-        
+        gdf = self.ensure_unique_column_names(gdf)
+        return gdf
+
     def ensure_unique_column_names(self, gdf):    
         # Truncate column names and ensure uniqueness
         unique_columns = {}
@@ -60,6 +66,11 @@ class OSMFerryTerminalDataDownloader:
             else:
                 unique_columns[col_truncated] = 1
             gdf.rename(columns={col: col_truncated}, inplace=True)
+        return gdf
+
+    def save_data(self, gdf):
+        # Make directories if they don't exist
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
         # Save the data to a GeoPackage
         if not gdf.empty:
@@ -1,7 +1,9 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import geometries_from_polygon
 
 class OSMFerryRouteDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -15,17 +17,23 @@ class OSMFerryRouteDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/232_tran/{country_code}_tran_fer_ln_s2_osm_pp_ferryroute.gpkg"
     
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the Area of Interest (AOI) from the GeoJSON file
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Check if the geometry is a Polygon or MultiPolygon
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download data from OSM based on the provided tags and the geometry of the AOI
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        gdf = geometries_from_polygon(geometry, tags=self.osm_tags)
+        return prune_columns(gdf, self.attributes)
 
+    def process_data(self, gdf):
         # Ensure all tags are represented as columns, even if no data is present
         for key in self.osm_tags.values():
             if key not in gdf.columns:
@@ -47,10 +55,6 @@ class OSMFerryRouteDataDownloader:
         columns_to_keep = list(columns_to_keep)  # Convert back to list if necessary for further operations
         gdf = gdf[columns_to_keep]
 
-
-        # Make directories if they don't exist
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-
         # Truncate column names and ensure uniqueness
         unique_columns = {}
         for col in gdf.columns:
@@ -61,6 +65,11 @@ class OSMFerryRouteDataDownloader:
             else:
                 unique_columns[col_truncated] = 1
             gdf.rename(columns={col: col_truncated}, inplace=True)
+        return gdf
+
+    def save_data(self, gdf):
+        # Make directories if they don't exist
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
         # Save the data to a GeoPackage
         if not gdf.empty:
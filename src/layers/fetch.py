@@ -0,0 +1,227 @@
+import contextlib
+import re
+import geopandas as gpd
+import numpy as np
+import osmnx as ox
+import pandas as pd
+from osmnx import _overpass, features
+
+# Layers get their OSM data through the functions below. By default they query Overpass through
+# osmnx; 'use_source' swaps in another source for a while, e.g. one backed by a split planet
+# extract (see runner/splitter.py). A source implements 'geometries_from_polygon',
+# 'fetch_features', 'fetch_centroids', 'fetch_centroids_near' and 'edges_from_polygon' with the
+# signatures of the functions here.
+_source = None
+
+
+@contextlib.contextmanager
+def use_source(source):
+    global _source
+    previous, _source = _source, source
+    try:
+        yield source
+    finally:
+        _source = previous
+
+
+# The source in use, None for Overpass
+def current_source():
+    return _source
+
+
+# osmnx 'geometries_from_polygon': the entries of 'tags' are alternatives
+def geometries_from_polygon(polygon, tags):
+    if _source is not None:
+        return _source.geometries_from_polygon(polygon, tags)
+    return ox.geometries_from_polygon(polygon, tags=tags)
+
+
+# Edges of the street network of 'network_type', as returned by osmnx 'graph_to_gdfs'
+def edges_from_polygon(polygon, network_type):
+    if _source is not None:
+        return _source.edges_from_polygon(polygon, network_type)
+    graph = ox.graph_from_polygon(polygon, network_type=network_type)
+    _, gdf_edges = ox.graph_to_gdfs(graph)
+    return gdf_edges
+
+
+def _tag_clause(key, value):
+    if value is True:
+        return f"[{key!r}]"
+    if isinstance(value, str):
+        return f"[{key!r}={value!r}]"
+    pattern = '^(' + '|'.join(re.escape(v) for v in value) + ')$'
+    return f"[{key!r}~{pattern!r}]"
+
+
+def _create_query(polygon_coord_str, filters):
+    components = []
+    for tags in filters:
+        clauses = ''.join(_tag_clause(key, value) for key, value in tags.items())
+        for kind in ['node', 'way', 'relation']:
+            components.append(f"({kind}{clauses}(poly:{polygon_coord_str!r});(._;>;););")
+    return f"{_overpass._make_overpass_settings()};({''.join(components)});out;"
+
+
+# An osmnx tags dict as filters: one single-tag filter per entry
+def tags_to_filters(tags):
+    return [{key: value} for key, value in tags.items()]
+
+
+# Union of the filters as an osmnx tags dict, used for osmnx's own tag filtering of the response
+def merge_tags(filters):
+    merged = {}
+    for tags in filters:
+        for key, value in tags.items():
+            if value is True or merged.get(key) is True:
+                merged[key] = True
+                continue
+            values = merged.setdefault(key, [])
+            for v in [value] if isinstance(value, str) else value:
+                if v not in values:
+                    values.append(v)
+    return merged
+
+
+# Boolean mask of the rows matching at least one filter with all of its tags
+def match_filters(gdf, filters):
+    matched = pd.Series(False, index=gdf.index)
+    for tags in filters:
+        mask = pd.Series(True, index=gdf.index)
+        for key, value in tags.items():
+            if key not in gdf.columns:
+                mask[:] = False
+                break
+            if value is True:
+                mask &= gdf[key].notna()
+            elif isinstance(value, str):
+                mask &= gdf[key] == value
+            else:
+                mask &= gdf[key].isin(value)
+        matched |= mask
+    return matched
+
+
+# Fetch the features matching any of several tag filters with one Overpass request (per subdivided
+# query polygon) instead of one full-country query per filter. Unlike osmnx, where the entries of a
+# tags dict are alternatives, a filter here matches only the elements carrying all of its tags, e.g.
+#   [{'amenity': 'atm'}, {'amenity': 'bank', 'atm': 'yes'}]
+# Tag values are True (any value), a string or a list of strings. The result keeps osmnx's
+# (element_type, osmid) index and holds each element once, however many filters it matches.
+def fetch_features(polygon, filters):
+    if _source is not None:
+        return _source.fetch_features(polygon, filters)
+    if not polygon.is_valid:
+        raise ValueError("The geometry of the query polygon is invalid")
+
+    response_jsons = (
+        _overpass._overpass_request(data={'data': _create_query(polygon_coord_str, filters)})
+        for polygon_coord_str in _overpass._make_overpass_polygon_coord_strs(polygon)
+    )
+    gdf = features._create_gdf(response_jsons, polygon, merge_tags(filters))
+    if gdf.empty:
+        return gdf
+
+    # Child features of a match (e.g. a tagged node of a matched way) pass osmnx's any-tag filter
+    gdf = gdf[match_filters(gdf, filters)]
+    # The (element_type, osmid) index identifies an element, so keep one row per element
+    return gdf[~gdf.index.duplicated()]
+
+
+def _create_centroid_query(polygon_coord_str, filters):
+    nodes = []
+    areas = []
+    for tags in filters:
+        clauses = ''.join(_tag_clause(key, value) for key, value in tags.items())
+        nodes.append(f"node{clauses}(poly:{polygon_coord_str!r});")
+        areas.append(f"way{clauses}(poly:{polygon_coord_str!r});relation{clauses}(poly:{polygon_coord_str!r});")
+    # Nodes come with their position; ways and relations with their tags and centre only
+    return f"{_overpass._make_overpass_settings()};({''.join(nodes)});out;({''.join(areas)});out tags center;"
+
+
+def _create_near_query(polygon_coord_str, filters, near_filters, distance):
+    candidates = []
+    for tags in filters:
+        clauses = ''.join(_tag_clause(key, value) for key, value in tags.items())
+        candidates.extend(f"{kind}{clauses}(poly:{polygon_coord_str!r});" for kind in ['node', 'way', 'relation'])
+    near = []
+    for tags in near_filters:
+        clauses = ''.join(_tag_clause(key, value) for key, value in tags.items())
+        near.extend(f"{kind}{clauses}(around.candidates:{distance});" for kind in ['node', 'way', 'relation'])
+    # The features near any candidate are looked up around the candidates, so those just outside the
+    # query polygon count too; then only the candidates near one of them are returned
+    return (f"{_overpass._make_overpass_settings()};({''.join(candidates)})->.candidates;({''.join(near)})->.near;"
+            f"node.candidates(around.near:{distance});out;(way.candidates(around.near:{distance});"
+            f"relation.candidates(around.near:{distance}););out tags center;")
+
+
+# Points of the elements of centroid query responses within 'polygon', see 'fetch_centroids'. osmnx
+# queries a multipolygon or an oversized polygon as its convex hull, so the responses hold elements
+# around the polygon too; like osmnx's own filtering of features, only those inside are kept. An
+# area is kept when its centre lies inside.
+def _centroids_gdf(response_jsons, polygon):
+    element_types, osmids, tags, lons, lats = [], [], [], [], []
+    for response_json in response_jsons:
+        for element in response_json['elements']:
+            position = element if element['type'] == 'node' else element.get('center')
+            # Relations without any member inside the data have no centre
+            if position is None:
+                continue
+            element_types.append(element['type'])
+            osmids.append(element['id'])
+            tags.append(element.get('tags', {}))
+            lons.append(position['lon'])
+            lats.append(position['lat'])
+    if not osmids:
+        return gpd.GeoDataFrame(geometry=[], crs=4326)
+
+    gdf = gpd.GeoDataFrame(pd.DataFrame.from_records(tags), geometry=gpd.points_from_xy(lons, lats), crs=4326)
+    gdf.index = pd.MultiIndex.from_arrays([element_types, osmids], names=['element_type', 'osmid'])
+    # An element is returned once per subdivided query polygon it falls in
+    gdf = gdf[~gdf.index.duplicated()]
+    return gdf.iloc[np.sort(gdf.sindex.query(polygon, predicate='intersects'))]
+
+
+# Like 'fetch_features', but every element comes back as a point: a node at its position, a way or
+# relation at the centre of its bounding box as computed by Overpass ('out center'). The member
+# nodes of ways and relations are neither transferred nor assembled into geometries, which is most
+# of the response for area-heavy tags. For the point layers, which reduce every feature to a point.
+def fetch_centroids(polygon, filters):
+    if _source is not None:
+        return _source.fetch_centroids(polygon, filters)
+    if not polygon.is_valid:
+        raise ValueError("The geometry of the query polygon is invalid")
+
+    response_jsons = (
+        _overpass._overpass_request(data={'data': _create_centroid_query(polygon_coord_str, filters)})
+        for polygon_coord_str in _overpass._make_overpass_polygon_coord_strs(polygon)
+    )
+    return _centroids_gdf(response_jsons, polygon)
+
+
+# 'fetch_centroids' of the elements matching 'filters' that lie within 'distance' metres of an element
+# matching 'near_filters', e.g. industrial areas near a coastline. Overpass measures the distance
+# ('around') between the full geometries on the server, so only the matching candidates' centres are
+# transferred and the near elements themselves never are.
+def fetch_centroids_near(polygon, filters, near_filters, distance):
+    if _source is not None:
+        return _source.fetch_centroids_near(polygon, filters, near_filters, distance)
+    if not polygon.is_valid:
+        raise ValueError("The geometry of the query polygon is invalid")
+
+    response_jsons = (
+        _overpass._overpass_request(data={'data': _create_near_query(polygon_coord_str, filters, near_filters, distance)})
+        for polygon_coord_str in _overpass._make_overpass_polygon_coord_strs(polygon)
+    )
+    return _centroids_gdf(response_jsons, polygon)
+
+
+# 'fetch_centroids' over several query polygons, e.g. the pieces of a band along the AOI boundary
+# (see aoi.boundary_tiles), each queried on its own and clipped to its piece; an element on the edge
+# of two is kept once
+def fetch_centroids_in(polygons, filters):
+    frames = [gdf for gdf in (fetch_centroids(polygon, filters) for polygon in polygons) if not gdf.empty]
+    if not frames:
+        return gpd.GeoDataFrame(geometry=[], crs=4326)
+    gdf = pd.concat(frames)
+    return gdf[~gdf.index.duplicated()]
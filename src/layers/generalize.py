@@ -0,0 +1,44 @@
+import re
+import geopandas as gpd
+import shapely
+from layers.columns import wkb_series
+
+# Simplification tolerance in metres per scale code of the output names, about half a millimetre
+# at the map scale the code stands for. Outputs at a layer's own scale code keep full detail.
+SCALE_TOLERANCES = {
+    's0': 0,
+    's1': 12.5,
+    's2': 50,
+    's3': 250,
+    's4': 1000,
+}
+
+
+# Output filename of a scale variant: the scale code in the name is swapped, e.g. '_s0_' for '_s2_'
+def scale_filename(filename, scale):
+    return re.sub(r'_s\d_', f'_{scale}_', str(filename), count=1)
+
+
+# Yield a (scale, frame) pair per scale with the frame's lines and polygons simplified for that
+# scale. The geometries are projected to the metric 'crs' once and simplified for every scale with
+# shapely's vectorised simplify. 'preserve_topology' keeps each geometry valid on its own, so none
+# collapses or self-intersects, but features are simplified independently: an edge shared by two
+# adjacent lakes, or a junction of two roads, can open a gap or overlap at the coarser tolerances.
+# Works on GeoDataFrames and compact frames (layers.columns.to_compact) with their CRS given as
+# 'frame_crs'; the attributes are shared with the input frame, only the geometry column is replaced.
+def generalized_variants(frame, scales, crs, frame_crs=None, geometry_name='geometry'):
+    if isinstance(frame, gpd.GeoDataFrame):
+        geometry_name = frame.geometry.name
+        geometries = frame.geometry
+    else:
+        if frame_crs is None:
+            raise ValueError("The CRS of a compact frame must be given")
+        geometries = gpd.GeoSeries.from_wkb(frame[geometry_name].to_numpy(dtype=object), index=frame.index, crs=frame_crs)
+    projected = geometries.to_crs(crs).to_numpy()
+
+    for scale in scales:
+        simplified = shapely.simplify(projected, SCALE_TOLERANCES[scale], preserve_topology=True)
+        simplified = gpd.GeoSeries(simplified, index=frame.index, crs=crs).to_crs(geometries.crs)
+        variant = frame.copy(deep=False)
+        variant[geometry_name] = simplified if isinstance(frame, gpd.GeoDataFrame) else wkb_series(simplified)
+        yield scale, variant
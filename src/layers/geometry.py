@@ -0,0 +1,145 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# shapely geometry type ids
+POLYGON_TYPES = [3, 6]
+GEOMETRYCOLLECTION = 7
+
+
+# Polygonal part of each geometry: make_valid can turn a broken ring into a collection of polygons,
+# lines and points. Geometries without any polygonal part become None.
+def _polygonal_parts(geometries):
+    geometries = geometries.copy()
+    collections = shapely.get_type_id(geometries) == GEOMETRYCOLLECTION
+    if collections.any():
+        parts, index = shapely.get_parts(geometries[collections], return_index=True)
+        # Members of a collection can be multi-part themselves
+        parts, member = shapely.get_parts(parts, return_index=True)
+        index = index[member]
+        polygons = shapely.get_type_id(parts) == 3
+        geometries[collections] = shapely.multipolygons(
+            parts[polygons], indices=index[polygons], out=np.empty(collections.sum(), dtype=object))
+    geometries[~np.isin(shapely.get_type_id(geometries), POLYGON_TYPES)] = None
+    return geometries
+
+
+# Validate all geometries of a frame at once and repair the invalid ones with make_valid, which
+# only runs on that subset. With 'polygons' set, only the polygonal part of a repaired geometry is
+# kept and rows left without one are dropped. Returns the frame and counts for the run metrics.
+def repair_geometries(gdf, polygons=True):
+    geometries = gdf.geometry.to_numpy()
+    invalid = ~shapely.is_valid(geometries) & ~shapely.is_missing(geometries)
+    counts = {'invalid_geometries': int(invalid.sum()), 'repaired_geometries': 0, 'dropped_geometries': 0}
+    if not counts['invalid_geometries']:
+        return gdf, counts
+
+    repaired = shapely.make_valid(geometries[invalid])
+    if polygons:
+        repaired = _polygonal_parts(repaired)
+    dropped = shapely.is_missing(repaired) | shapely.is_empty(repaired)
+    counts['repaired_geometries'] = int((~dropped).sum())
+    counts['dropped_geometries'] = int(dropped.sum())
+
+    geometries = geometries.copy()
+    geometries[invalid] = repaired
+    keep = np.ones(len(gdf), dtype=bool)
+    keep[np.flatnonzero(invalid)[dropped]] = False
+    gdf = gdf.copy()
+    gdf[gdf.geometry.name] = gpd.array.from_shapely(geometries, crs=gdf.crs)
+    return gdf[keep], counts
+
+
+# Connected component of every node of the graph given by the edge arrays 'left' and 'right',
+# labelled by its smallest node
+def _components(n, left, right):
+    labels = np.arange(n)
+    while True:
+        smallest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, smallest)
+        np.minimum.at(updated, right, smallest)
+        # Pointer jumping: every node takes its label's label, so long chains collapse quickly
+        updated = updated[updated]
+        if (updated == labels).all():
+            return labels
+        labels = updated
+
+
+# Merge touching or overlapping polygons that share the values of the 'by' columns (e.g. the
+# riverbank pieces of one named river) into one feature per connected group. Neighbours are found
+# with one bulk spatial index query; only groups of two or more polygons are unioned. Returns the
+# frame and the number of features merged away for the run metrics.
+def dissolve_touching(gdf, by):
+    by = [col for col in by if col in gdf.columns]
+    if len(gdf) < 2:
+        return gdf, {'dissolved_geometries': 0}
+    keys = gdf.groupby(by, dropna=False, sort=False, observed=True).ngroup().to_numpy() if by else np.zeros(len(gdf), dtype=int)
+    left, right = gdf.sindex.query(gdf.geometry.values, predicate='intersects')
+    same = (left < right) & (keys[left] == keys[right])
+    labels = _components(len(gdf), left[same], right[same])
+
+    grouped = pd.Series(labels).duplicated(keep=False).to_numpy()
+    if not grouped.any():
+        return gdf, {'dissolved_geometries': 0}
+    merged = gdf[grouped].copy()
+    merged['_component'] = labels[grouped]
+    merged = merged.dissolve(by='_component', aggfunc='first', sort=False).reset_index(drop=True)
+    merged = merged[gdf.columns]
+    result = pd.concat([gdf[~grouped], merged], ignore_index=True)
+    return result, {'dissolved_geometries': len(gdf) - len(result)}
+
+
+# Values of a 'directed' column that mark a line as one-way
+DIRECTED_VALUES = [True, 'yes', 'true', '1']
+
+
+# Join line segments that share the values of the 'by' columns (e.g. the ways of one named river)
+# into continuous lines. Segment ends are indexed by their exact coordinates, which OSM ways share at
+# the nodes joining them, and two segments are joined where they are the only two ending at a node;
+# at confluences and junctions the lines stay apart. Rows whose 'directed' column is set (e.g. one-way
+# roads) are only joined end to start and keep their direction. Returns the frame and the number of
+# features merged away for the run metrics.
+def merge_lines(gdf, by, directed=None):
+    by = [col for col in by if col in gdf.columns]
+    lines = (gdf.geom_type == 'LineString').to_numpy()
+    if lines.sum() < 2:
+        return gdf, {'merged_lines': 0}
+    segments = gdf[lines]
+    geometries = segments.geometry.values
+    keys = segments.groupby(by, dropna=False, sort=False, observed=True).ngroup().to_numpy() if by else np.zeros(len(segments), dtype=int)
+    is_directed = segments[directed].isin(DIRECTED_VALUES).to_numpy() if directed else np.zeros(len(segments), dtype=bool)
+
+    ends = np.concatenate([shapely.get_coordinates(shapely.get_point(geometries, 0)),
+                           shapely.get_coordinates(shapely.get_point(geometries, -1))])
+    index = np.tile(np.arange(len(segments)), 2)
+    nodes = pd.DataFrame({'key': np.tile(keys, 2), 'x': ends[:, 0], 'y': ends[:, 1], 'segment': index,
+                          'start': np.repeat([True, False], len(segments))})
+    nodes = nodes.sort_values(['key', 'x', 'y'], kind='stable')
+    degree = nodes.groupby(['key', 'x', 'y'], sort=False)['segment'].transform('size').to_numpy()
+    # The ends meeting at a node of degree two are adjacent after the sort
+    pairs = nodes['segment'].to_numpy()[degree == 2].reshape(-1, 2)
+    starts = nodes['start'].to_numpy()[degree == 2].reshape(-1, 2)
+    pairs = pairs[~is_directed[pairs[:, 0]] | (starts[:, 0] != starts[:, 1])]
+    labels = _components(len(segments), pairs[:, 0], pairs[:, 1])
+
+    grouped = pd.Series(labels).duplicated(keep=False).to_numpy()
+    if not grouped.any():
+        return gdf, {'merged_lines': 0}
+    component = np.unique(labels[grouped], return_inverse=True)[1]
+    order = np.argsort(component, kind='stable')
+    chains = shapely.multilinestrings(geometries[grouped][order], indices=component[order])
+    # Each merged line keeps the attributes of its chain's first segment
+    first = np.unique(component, return_index=True)[1]
+    merged = segments[grouped].iloc[first].copy()
+    merged_geometries = shapely.line_merge(chains)
+    chain_directed = is_directed[grouped][first]
+    if chain_directed.any():
+        merged_geometries[chain_directed] = shapely.line_merge(chains[chain_directed], directed=True)
+    merged[merged.geometry.name] = gpd.array.from_shapely(merged_geometries, crs=gdf.crs)
+    # A chain that line_merge cannot join into one line is kept as its parts
+    merged = merged.explode(index_parts=False)
+
+    result = pd.concat([gdf[~lines], segments[~grouped], merged], ignore_index=True)
+    return result, {'merged_lines': len(gdf) - len(result)}
@@ -1,7 +1,9 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, tags_to_filters
 
 class OSMHealthDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -17,25 +19,29 @@ class OSMHealthDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/215_heal/{country_code}_heal_hea_pt_s3_osm_pp_healthfacilities.shp"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the region of interest geometry
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Ensure the geometry is appropriate
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download health facility data
-        gdf_health = ox.geometries_from_polygon(geometry, tags=self.osm_tags_health)
+        gdf_health = fetch_centroids(geometry, tags_to_filters(self.osm_tags_health))
+        return prune_columns(gdf_health, self.attributes + list(self.osm_tags_health))
 
+    def process_data(self, gdf_health):
         # Process geometries to centroid points
         gdf_health = self.process_geometries(gdf_health)
 
         # Ensure unique column names
         gdf_health = self.ensure_unique_column_names(gdf_health)
-
-        # Save the processed data
-        self.save_data(gdf_health)
+        return gdf_health
 
     def process_geometries(self, gdf):
         # Create centroids for polygon geometries and reproject
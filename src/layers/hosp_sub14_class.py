@@ -1,9 +1,14 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, tags_to_filters
 
 class OSMHospitalDataDownloader:
+    # Hospitals are health facilities: taken from the health facility layer's data when it runs too
+    derived_from = '11'
+
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.crs_project = crs_project
@@ -15,26 +20,30 @@ class OSMHospitalDataDownloader:
         ox.settings.use_cache = True
         self.output_filename = f"data/out/country_extractions/{country_code}/215_heal/{country_code}_heal_hea_pt_s3_osm_pp_hospital.shp"
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the region of interest geometry
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Ensure the geometry is appropriate
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download hospital data
-        gdf_hospitals = ox.geometries_from_polygon(geometry, tags=self.osm_tags_hospital)
+        gdf_hospitals = fetch_centroids(geometry, tags_to_filters(self.osm_tags_hospital))
+        return prune_columns(gdf_hospitals, self.attributes)
 
+    def process_data(self, gdf_hospitals):
         # Process geometries to centroid points
         gdf_hospitals = self.process_geometries(gdf_hospitals)
 
         # Ensure unique column names and presence of required fields
         gdf_hospitals = self.ensure_unique_column_names(gdf_hospitals)
         gdf_hospitals = self.ensure_required_fields(gdf_hospitals)
-
-        # Save the processed data
-        self.save_data(gdf_hospitals)
+        return gdf_hospitals
 
     def process_geometries(self, gdf):
         # Create centroids for polygon geometries and reproject
@@ -1,7 +1,11 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import geometries_from_polygon
+from layers.generalize import generalized_variants, scale_filename
+from layers.geometry import dissolve_touching, repair_geometries
 
 class OSMLargeRiverDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -10,25 +14,41 @@ class OSMLargeRiverDataDownloader:
         self.crs_global = crs_global
         self.osm_tags = {'water': 'river'}
         self.attributes = ['name', 'name:en', 'name_en']
+        # Optionally merge touching polygons of the same class and name into one feature (--dissolve)
+        self.dissolve = False
+        self.dissolve_by = ['fclass', 'name']
         ox.config(log_console=True, use_cache=True)
         self.output_filename = f"data/out/country_extractions/{country_code}/221_phys/{country_code}_phys_riv_py_s3_osm_pp_rivers.shp"
+        # Coarser scales also written, each simplified from the full-detail frame
+        self.generalized_scales = ['s4']
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        gdf = geometries_from_polygon(geometry, tags=self.osm_tags)
+        return prune_columns(gdf, self.attributes + list(self.osm_tags))
+
+    def process_data(self, gdf):
         gdf = gdf[gdf.geometry.type.isin(['Polygon', 'MultiPolygon'])]
+        # River area relations often come back as invalid multipolygons; repair them in bulk before any other step
+        gdf, self.metrics = repair_geometries(gdf)
         gdf_projected = gdf.to_crs(epsg=self.crs_project)
         gdf_projected = gdf_projected.to_crs(epsg=self.crs_global)
 
         gdf_projected = self.process_list_fields(gdf_projected)
+        if self.dissolve:
+            gdf_projected, dissolved = dissolve_touching(gdf_projected, self.dissolve_by)
+            self.metrics.update(dissolved)
         gdf_projected = self.ensure_unique_column_names(gdf_projected)
-
-        self.save_data(gdf_projected)
+        return gdf_projected
 
     def process_list_fields(self, gdf):
         for col in gdf.columns:
@@ -65,5 +85,8 @@ class OSMLargeRiverDataDownloader:
         os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
         try:
             gdf.to_file(self.output_filename, driver='ESRI Shapefile')
+            # Simplified copies for small-scale maps, from the same frame
+            for scale, variant in generalized_variants(gdf, self.generalized_scales, load_aoi(self.geojson_path, self.crs_project).projected_crs):
+                variant.to_file(scale_filename(self.output_filename, scale), driver='ESRI Shapefile')
         except Exception as e:
             print(f"An error occurred while saving the GeoDataFrame: {e}")
\ No newline at end of file
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from hashlib import sha1
+from osmnx import _downloader, settings
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+# Managed cache for the responses osmnx fetches (Overpass, Nominatim). osmnx's own cache keeps one
+# uncompressed JSON file per request and never deletes any; this one stores the responses
+# zstd-compressed, keeps their sizes and last use in an SQLite index and evicts the least recently
+# used responses once the cache exceeds 'max_bytes'. osmnx has no public hook for its cache, so the
+# two functions its request helpers call through the '_downloader' module are replaced once per
+# process. The layers' 'use_cache' setting still switches caching on and off.
+CACHE_DIR = 'cache/osm'
+MAX_CACHE_BYTES = 10 * 1024 ** 3
+COMPRESSION_LEVEL = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_installed = False
+_cache = None
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # Shared by the pipeline's threads under 'self.lock'; other processes on the same cache wait on SQLite's lock
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), timeout=60, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.zst")
+
+    def get(self, url):
+        key = sha1(url.encode('utf-8')).hexdigest()
+        with self.lock:
+            row = self.db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = zstd.ZstdDecompressor().decompress(f.read())
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the read
+            with self.lock:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        with self.lock:
+            self.db.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(data)
+
+    def put(self, url, response_json):
+        key = sha1(url.encode('utf-8')).hexdigest()
+        data = zstd.ZstdCompressor(level=COMPRESSION_LEVEL).compress(json.dumps(response_json).encode('utf-8'))
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers in other processes never see a half-written response
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)', (key, len(data), time.time()))
+            return self.evict()
+
+    # Delete the least recently used responses until the cache fits in 'max_bytes'; returns how many went
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        evicted = 0
+        if total <= self.max_bytes:
+            return evicted
+        for key, size in self.db.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def summary(self):
+        with self.lock:
+            entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+def install(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    global _installed, _cache
+    with _lock:
+        if _installed or not hasattr(_downloader, '_retrieve_from_cache'):
+            return
+        retrieve = _downloader._retrieve_from_cache
+        save = _downloader._save_to_cache
+        if zstd is None:
+            logging.warning("zstandard is not installed; falling back to osmnx's uncompressed response cache")
+        else:
+            _cache = ResponseCache(cache_dir, max_bytes)
+
+        def cached_retrieve(url, check_remark=True):
+            if _cache is None:
+                response_json = retrieve(url, check_remark)
+            elif not settings.use_cache:
+                response_json = None
+            else:
+                response_json = _cache.get(url)
+                if response_json is None:
+                    # A response still in osmnx's old cache folder moves into the managed cache on first use
+                    response_json = retrieve(url, check_remark)
+                    if response_json is not None:
+                        _cache.put(url, response_json)
+                        os.remove(_downloader._url_in_cache(url))
+            with _lock:
+                _stats['hits' if response_json is not None else 'misses'] += 1
+            return response_json
+
+        def cached_save(url, response_json, ok):
+            if _cache is None:
+                return save(url, response_json, ok)
+            # Responses with a server remark (e.g. a timeout) are incomplete and are not kept
+            if settings.use_cache and ok and response_json is not None and 'remark' not in response_json:
+                evicted = _cache.put(url, response_json)
+                with _lock:
+                    _stats['evictions'] += evicted
+
+        _downloader._retrieve_from_cache = cached_retrieve
+        _downloader._save_to_cache = cached_save
+        _installed = True
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+if __name__ == "__main__":
+    if zstd is None:
+        sys.exit("zstandard is not installed; the managed cache is not in use")
+    summary = ResponseCache(sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR).summary()
+    print(f"{summary['entries']} responses, {summary['bytes'] / 1024 ** 2:.1f} MiB of {summary['max_bytes'] / 1024 ** 2:.0f} MiB")
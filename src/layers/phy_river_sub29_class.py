@@ -1,31 +1,47 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import geometries_from_polygon
+from layers.generalize import generalized_variants, scale_filename
+from layers.geometry import merge_lines
 
 class OSMRiverDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.output_filename = f"data/out/country_extractions/{country_code}/221_phys/{country_code}_phys_riv_ln_s3_osm_pp_rivers.shp"
+        # Coarser scales also written, each simplified from the full-detail frame
+        self.generalized_scales = ['s4']
         self.crs_project = crs_project
         self.crs_global = crs_global
         self.osm_key = 'waterway'
         self.osm_value = 'river'
         self.exclude_values = ['stream', 'canal', 'ditch', 'drain']
         self.attributes = ['name', 'name:en', 'name_en']
+        # Optionally join contiguous segments of the same class and name into continuous lines (--merge-lines)
+        self.merge_lines = False
+        self.merge_by = ['fclass', 'name']
         ox.config(log_console=True, use_cache=True)
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the region of interest geometry
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Ensure the geometry is a polygon
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download OSM data
-        gdf = ox.geometries_from_polygon(geometry, {self.osm_key: self.osm_value})
+        gdf = geometries_from_polygon(geometry, {self.osm_key: self.osm_value})
+        return prune_columns(gdf, self.attributes + [self.osm_key])
+
+    def process_data(self, gdf):
         gdf = gdf[~gdf[self.osm_key].isin(self.exclude_values)]
         gdf = gdf[gdf.geometry.type == 'LineString']
 
@@ -35,12 +51,12 @@ class OSMRiverDataDownloader:
 
         # Handle list-type fields
         gdf_projected = self.process_list_fields(gdf_projected)
+        if self.merge_lines:
+            gdf_projected, self.metrics = merge_lines(gdf_projected, self.merge_by)
 
         # Ensure unique column names
         gdf_projected = self.ensure_unique_column_names(gdf_projected)
-
-        # Save the GeoDataFrame
-        self.save_data(gdf_projected)
+        return gdf_projected
 
     def process_list_fields(self, gdf):
         for col in gdf.columns:
@@ -76,5 +92,8 @@ class OSMRiverDataDownloader:
         os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
         try:
             gdf.to_file(self.output_filename, driver='ESRI Shapefile')
+            # Simplified copies for small-scale maps, from the same frame
+            for scale, variant in generalized_variants(gdf, self.generalized_scales, load_aoi(self.geojson_path, self.crs_project).projected_crs):
+                variant.to_file(scale_filename(self.output_filename, scale), driver='ESRI Shapefile')
         except Exception as e:
             print(f"An error occurred while saving the GeoDataFrame: {e}")
\ No newline at end of file
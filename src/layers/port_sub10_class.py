@@ -1,6 +1,9 @@
 import os
 import osmnx as ox
-import geopandas as gpd
+import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, fetch_centroids_near, tags_to_filters
 
 class OSMPortDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -11,17 +14,54 @@ class OSMPortDataDownloader:
         ox.settings.log_console = True
         ox.settings.use_cache = True
         self.attributes = ['name', 'name:en', 'name_en']
+        # Metres; when set, industrial areas are only kept this close to a coastline, harbour or
+        # navigable waterway (--ports-near-water) instead of every industrial estate of the country
+        self.near_water = None
+        self.near_water_landuse = 'industrial'
+        # Coastlines, canals and fairways, and the rivers tagged as navigable for ships or boats
+        self.water_filters = [
+            {'natural': 'coastline'},
+            {'waterway': ['canal', 'fairway']},
+            {'waterway': 'river', 'ship': 'yes'},
+            {'waterway': 'river', 'boat': 'yes'},
+            {'waterway': 'river', 'CEMT': True},
+        ]
         self.output_filename = f"data/out/country_extractions/{country_code}/232_tran/{country_code}_tran_por_pt_s0_osm_pp_port.shp"
         
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        if self.near_water is None:
+            gdf = fetch_centroids(geometry, tags_to_filters(self.osm_tags))
+        else:
+            gdf = self.fetch_near_water(geometry)
+        return prune_columns(gdf, self.attributes + list(self.osm_tags))
+
+    # Harbours and ports are fetched as before. Of the industrial areas only those within 'near_water'
+    # metres of a harbour, port or water feature come back: Overpass measures the distance on the
+    # server, so no water geometry is downloaded.
+    def fetch_near_water(self, geometry):
+        landuse = [value for value in self.osm_tags['landuse'] if value != self.near_water_landuse]
+        port_filters = tags_to_filters({**self.osm_tags, 'landuse': landuse})
+        ports = fetch_centroids(geometry, port_filters)
+        industrial = fetch_centroids_near(geometry, [{'landuse': self.near_water_landuse}], port_filters + self.water_filters,
+                                          self.near_water)
+        frames = [gdf for gdf in [ports, industrial] if not gdf.empty]
+        if not frames:
+            return ports
+        gdf = pd.concat(frames)
+        return gdf[~gdf.index.duplicated()]
+
+    def process_data(self, gdf):
         gdf = gdf.to_crs(epsg=self.crs_project)
         gdf['geometry'] = gdf.geometry.centroid
         gdf = gdf.to_crs(epsg=self.crs_global)
@@ -31,11 +71,8 @@ class OSMPortDataDownloader:
         for col in list_type_cols:
             gdf[col] = gdf[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
 
-        # Make directories if they don't exist
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-
-
-        gdf['fclass'] = gdf['landuse']
+        # Features tagged harbour=port only have no landuse
+        gdf['fclass'] = gdf.get('landuse')
         actual_tags = gdf.columns.intersection(self.attributes)
         missing_tags = set(self.attributes) - set(actual_tags)
         if missing_tags:
@@ -45,8 +82,12 @@ class OSMPortDataDownloader:
         gdf = gdf[collumns_to_keep]
 
         self.ensure_unique_column_names(gdf)
+        return gdf
+
+    def save_data(self, gdf):
+        # Make directories if they don't exist
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
-        # Save the data to a GeoPackage
         try:
             gdf.to_file(self.output_filename, driver='ESRI Shapefile')
         except Exception as e:
@@ -1,6 +1,8 @@
 import os
 import osmnx as ox
-import geopandas as gpd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids
 
 class OSMRailwayStationDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -15,13 +17,20 @@ class OSMRailwayStationDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/232_tran/{country_code}_tran_rst_pt_s2_osm_pp_railwaystation.shp"
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags={self.osm_key: self.osm_values})
+        gdf = fetch_centroids(geometry, [{self.osm_key: self.osm_values}])
+        return prune_columns(gdf, self.attributes + [self.osm_key])
+
+    def process_data(self, gdf):
         gdf = gdf[gdf[self.osm_key].isin(self.osm_values)]
 
         # Reproject geometries to the specified projection before calculating centroids
@@ -34,8 +43,7 @@ class OSMRailwayStationDataDownloader:
 
         gdf_projected = self.process_list_fields(gdf_projected)
         gdf_projected = self.ensure_unique_column_names(gdf_projected)
-
-        self.save_data(gdf_projected)
+        return gdf_projected
     
     def process_list_fields(self, gdf):
         for col in gdf.columns:
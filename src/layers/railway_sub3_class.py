@@ -1,35 +1,44 @@
 
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
 from pathlib import Path
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import geometries_from_polygon
+from layers.generalize import generalized_variants, scale_filename
 
 class OSMRailwayDataDownloader:
     railway_tags = {
         'railway': ['rail', 'narrow_gauge', 'subway'],
         '!railway': ['miniature']
     }
+    attributes = ['name', 'name_en', 'name:en', 'gauge']
 
     def __init__(self, geojson_path, country_code):
         self.geojson_path = geojson_path
         ox.settings.log_console = True
         ox.settings.use_cache = True
         self.output_dir = f"data/out/country_extractions/{country_code}/232_tran/"
-        self.output_filename = f"{country_code}_tran_rst_pt_s2_osm_pp_railwaystation.shp"
+        self.output_filename = f"{country_code}_tran_rrd_ln_s0_osm_pp_railways.shp"
+        # Coarser scales also written, each simplified from the full-detail frame
+        self.generalized_scales = ['s2', 's3']
     
     def download_and_process_data(self):
-    # Ensure output directory exists
-        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
 
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry_type = region_gdf['geometry'].iloc[0].geom_type
+    def fetch_data(self):
+        polygon = load_aoi(self.geojson_path).query
+        geometry_type = polygon.geom_type
         if geometry_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        polygon = region_gdf['geometry'].iloc[0]
-        gdf = ox.geometries_from_polygon(polygon, tags=self.railway_tags)
-        
+        gdf = geometries_from_polygon(polygon, tags=self.railway_tags)
+        return prune_columns(gdf, self.attributes + ['railway'])
+
+    def process_data(self, gdf):
         # Filter out the 'miniature' railway
         gdf = gdf[~gdf['railway'].isin(self.railway_tags['!railway'])]
         gdf = gdf[gdf['railway'].isin(self.railway_tags['railway'])]
@@ -57,8 +66,8 @@ class OSMRailwayDataDownloader:
         # gdf = gdf[required_columns]
 
         # Identify the tags actually present in the data
-        actual_tags = gdf.columns.intersection(['name','name_en','name:en', 'gauge',])
-        missing_tags = set(['name','name_en','name:en','gauge']) - set(actual_tags)
+        actual_tags = gdf.columns.intersection(self.attributes)
+        missing_tags = set(self.attributes) - set(actual_tags)
         if missing_tags:
             print(f"Warning: The following tags are missing from the data and will not be included: {missing_tags}")
         
@@ -71,12 +80,16 @@ class OSMRailwayDataDownloader:
 
         # Ensure unique column names for Shapefile format
         gdf = self.ensure_unique_column_names(gdf)
+        return gdf
 
+    def save_data(self, gdf):
         if not gdf.empty:
             output_path = Path(self.output_dir) / self.output_filename
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             try:
                 gdf.to_file(filename=output_path, driver='ESRI Shapefile')
+                for scale, variant in generalized_variants(gdf, self.generalized_scales, load_aoi(self.geojson_path).projected_crs):
+                    variant.to_file(filename=scale_filename(output_path, scale), driver='ESRI Shapefile')
                 print(f"GeoDataFrame saved successfully to {output_path}")
             except Exception as e:
                 print(f"Failed to save GeoDataFrame: {e}")
@@ -0,0 +1,132 @@
+import importlib
+import inspect
+import logging
+import time
+
+# Layer key -> (module, class). Modules are imported only when one of their layers is requested,
+# so a single-layer run does not pay for the other eighteen.
+BUILTIN_LAYERS = {
+    "1": ('layers.road_sub1_class', 'OSMRoadDataDownloader'),
+    "2": ('layers.railway_sub3_class', 'OSMRailwayDataDownloader'),
+    "3": ('layers.dam_sub5_class', 'OSMDamDataDownloader'),
+    "4": ('layers.school_sub6_class', 'OSMSchoolDataDownloader'),
+    "5": ('layers.uni_sub7_class', 'OSMEducationDataDownloader'),
+    "6": ('layers.ferry_sub8_class', 'OSMFerryTerminalDataDownloader'),
+    "7": ('layers.ferry_sub9_class', 'OSMFerryRouteDataDownloader'),
+    "8": ('layers.port_sub10_class', 'OSMPortDataDownloader'),
+    "9": ('layers.bank_sub11_class', 'OSMBankDataDownloader'),
+    "10": ('layers.atm_sub12_class', 'OSMATMDataDownloader'),
+    "11": ('layers.health_fac_sub13_class', 'OSMHealthDataDownloader'),
+    "12": ('layers.hosp_sub14_class', 'OSMHospitalDataDownloader'),
+    "13": ('layers.border_control_sub18_class', 'OSMBorderControlDataDownloader'),
+    "14": ('layers.settlement_sub19_class', 'OSMSettlementsDataDownloader'),
+    "15": ('layers.waterbodies_sub27_class', 'OSMLakeDataDownloader'),
+    "16": ('layers.large_river_sub28_class', 'OSMLargeRiverDataDownloader'),
+    "17": ('layers.phy_river_sub29_class', 'OSMRiverDataDownloader'),
+    "18": ('layers.canal_sub30_class', 'OSMCanalDataDownloader'),
+    "19": ('layers.rail2_sub31_class', 'OSMRailwayStationDataDownloader'),
+}
+
+# Third-party packages register extra layers under this entry point group, e.g. in pyproject.toml:
+#   [project.entry-points."geocint_mapaction_osm.layers"]
+#   20 = "my_package.layers:OSMMarketDataDownloader"
+ENTRY_POINT_GROUP = 'geocint_mapaction_osm.layers'
+
+# Libraries every layer pulls in; timed separately so their cost is not charged to the first layer
+SHARED_MODULES = ['numpy', 'pandas', 'shapely', 'pyproj', 'networkx', 'geopandas', 'osmnx']
+
+_plugin_layers = None
+
+
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(eps.get(ENTRY_POINT_GROUP, []))
+
+
+# Layers contributed through entry points, discovered once per process without importing them
+def plugin_layers():
+    global _plugin_layers
+    if _plugin_layers is None:
+        _plugin_layers = {}
+        for ep in _entry_points():
+            if ep.name in BUILTIN_LAYERS:
+                logging.warning(f"Ignoring plugin layer {ep.name} ({ep.value}): key is used by a built-in layer")
+                continue
+            module, _, cls = ep.value.partition(':')
+            _plugin_layers[ep.name] = (module, cls)
+    return _plugin_layers
+
+
+def available_layers():
+    layers = dict(BUILTIN_LAYERS)
+    layers.update(plugin_layers())
+    return layers
+
+
+def layer_keys():
+    return list(available_layers())
+
+
+def get_layer_class(layer):
+    layers = available_layers()
+    if layer not in layers:
+        raise KeyError(f"Unknown layer {layer!r}; available layers: {', '.join(layers)}")
+    module, cls = layers[layer]
+    return getattr(importlib.import_module(module), cls)
+
+
+# Instantiate the downloader of one layer. Classes take either (geojson_path, country_code) or
+# (geojson_path, crs_project, crs_global, country_code); the constructor signature decides which.
+def create_layer(layer, geojson_path, country_code, crs_project, crs_global):
+    cls = get_layer_class(layer)
+    params = inspect.signature(cls.__init__).parameters
+    if 'crs_project' in params:
+        return cls(geojson_path, crs_project, crs_global, country_code)
+    return cls(geojson_path, country_code)
+
+
+# Import every layer module, e.g. to warm a long-running worker before its first job
+def import_layers(layers=None):
+    for layer in layers or layer_keys():
+        get_layer_class(layer)
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+# Measure the startup cost of the given layers: the import time of the shared libraries, then per
+# layer the import time of its module and the time to construct its downloader. Modules already
+# imported in this process report (close to) zero, so run this in a fresh interpreter.
+def measure_startup(layers, geojson_path, country_code, crs_project, crs_global):
+    rows = []
+    for module in SHARED_MODULES:
+        try:
+            _, seconds = _timed(lambda: importlib.import_module(module))
+        except ImportError:
+            continue
+        rows.append((module, 'import', seconds))
+    for layer in layers:
+        module, _ = available_layers()[layer]
+        _, import_seconds = _timed(lambda: get_layer_class(layer))
+        _, init_seconds = _timed(lambda: create_layer(layer, geojson_path, country_code, crs_project, crs_global))
+        rows.append((f"{layer}: {module}", 'import', import_seconds))
+        rows.append((f"{layer}: {module}", 'init', init_seconds))
+    return rows
+
+
+def format_startup_report(rows):
+    width = max(len(name) for name, _, _ in rows)
+    lines = [f"{'module'.ljust(width)}  stage   seconds"]
+    for name, stage, seconds in rows:
+        lines.append(f"{name.ljust(width)}  {stage.ljust(6)}  {seconds:8.4f}")
+    lines.append(f"{'total'.ljust(width)}          {sum(seconds for _, _, seconds in rows):8.4f}")
+    return '\n'.join(lines)
@@ -1,7 +1,13 @@
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+import numpy as np
 from pathlib import Path
+from layers.aoi import load_aoi
+from layers.columns import compact_series, prune_columns, to_compact, to_geodataframe
+from layers.fetch import edges_from_polygon
+from layers.generalize import generalized_variants, scale_filename
+from layers.geometry import merge_lines
+from layers.writer import iter_chunks, write_chunks
 
 class OSMRoadDataDownloader:
     osm_road_values = "motorway,trunk,primary,secondary,tertiary,unclassified,residential,motorway_link,trunk_link,primary_link,secondary_link,tertiary_link,lining_street,service,track,road"
@@ -14,48 +20,93 @@ class OSMRoadDataDownloader:
         ox.settings.use_cache = True
         self.output_dir = f"data/out/country_extractions/{country_code}/232_tran/"
         self.output_filename = f"{country_code}_tran_rds_ln_s0_osm_pp_roads.shp"
+        # Coarser scales also written, each simplified from the full-detail frame
+        self.generalized_scales = ['s2', 's3']
+        # Optionally join consecutive segments with identical attributes into continuous lines (--merge-lines)
+        self.merge_lines = False
+        # CRS of the compact edges, set by fetch_data
+        self.compact_crs = None
     
 
     def download_and_process_data(self):
-        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        gdf_edges = self.fetch_data()
+        all_roads_gdf = self.process_data(gdf_edges)
+        self.save_data(all_roads_gdf)
 
-        gdf = gpd.read_file(self.geojson_path)
-        geometry_type = gdf['geometry'].iloc[0].geom_type
+    def fetch_data(self):
+        polygon = load_aoi(self.geojson_path).query
+        geometry_type = polygon.geom_type
         if geometry_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
-        
-        polygon = gdf['geometry'].iloc[0]
-        graph = ox.graph_from_polygon(polygon, network_type='drive')
-        _, gdf_edges = ox.graph_to_gdfs(graph)
-        
-    
-        all_roads_gdf = gpd.GeoDataFrame()
 
-        for road_type in self.osm_road_values.split(','):
-            gdf_filtered = gdf_edges[gdf_edges['highway'].apply(lambda x: road_type in x if isinstance(x, list) else road_type == x)]
+        # Only parse the way tags we write out; 'junction' is kept because osmnx needs it to detect one-way
+        # roundabouts. The osmnx setting is global, so it only applies to this graph fetch.
+        useful_tags_way = ox.settings.useful_tags_way
+        ox.settings.useful_tags_way = ['highway', 'junction'] + self.osm_required_tags
+        try:
+            gdf_edges = edges_from_polygon(polygon, network_type='drive')
+        finally:
+            ox.settings.useful_tags_way = useful_tags_way
+        # From here until they are written, the edges stay compact (categorical/Arrow tags, WKB geometries)
+        self.compact_crs = gdf_edges.crs
+        return to_compact(prune_columns(gdf_edges, ['osmid', 'highway', 'length'] + self.osm_required_tags))
 
-            for tag in self.osm_required_tags:
-                if tag not in gdf_filtered.columns:
-                    gdf_filtered[tag] = pd.NA
+    def process_data(self, gdf_edges):
+        gdf_edges = self.collapse_reverse_edges(gdf_edges)
+        for tag in self.osm_required_tags:
+            if tag not in gdf_edges.columns:
+                gdf_edges[tag] = pd.NA
 
-     
-            gdf_filtered['fclass'] = road_type
-            list_type_cols = gdf_filtered.columns[gdf_filtered.dtypes == 'object']
-            for col in list_type_cols:
-                gdf_filtered[col] = gdf_filtered[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
-            
-           
-            all_roads_gdf = pd.concat([all_roads_gdf, gdf_filtered], ignore_index=True)
+        # Pair every edge position with each road type it matches (an edge whose 'highway' is a list can match
+        # several), grouped by road type in the order of 'osm_road_values' like the per-type filters used to be
+        road_types = self.osm_road_values.split(',')
+        highway = pd.Series(gdf_edges['highway'].to_numpy(), index=np.arange(len(gdf_edges))).explode()
+        matches = pd.DataFrame({'position': highway.index, 'fclass': pd.Categorical(highway, categories=road_types)})
+        matches = matches.dropna().drop_duplicates().sort_values('fclass', kind='stable')
+
+        # Tags holding lists stayed object columns; flattened, they can be compacted too
+        list_type_cols = gdf_edges.columns[gdf_edges.dtypes == 'object']
+        for col in list_type_cols:
+            gdf_edges[col] = compact_series(gdf_edges[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x))
+
+        all_roads_gdf = gdf_edges.iloc[matches['position'].to_numpy()].reset_index(drop=True)
+        all_roads_gdf['fclass'] = matches['fclass'].values
+        del gdf_edges
 
         all_roads_gdf = self.ensure_unique_column_names(all_roads_gdf)
 
        
         columns_to_keep = ['geometry','osmid' ,'fclass'] + self.osm_required_tags
         all_roads_gdf = all_roads_gdf[columns_to_keep]
+        if self.merge_lines:
+            # One-way segments only join head to tail; each merged line keeps the osmid of its first segment
+            all_roads_gdf, self.metrics = merge_lines(to_geodataframe(all_roads_gdf, self.compact_crs), ['fclass'] + self.osm_required_tags, directed='oneway')
+            all_roads_gdf = to_compact(all_roads_gdf)
+        return all_roads_gdf
+
+    # The drive graph is directed, so osmnx returns every two-way street twice, as u->v and v->u.
+    # The reverse copy joins the same two nodes along the same ways, so one edge is kept per pair of
+    # end nodes, set of ways and graph 'length' in metres. Lengths are compared to the centimetre:
+    # a simplified edge sums the lengths of its parts, in opposite order for the two directions.
+    def collapse_reverse_edges(self, gdf_edges):
+        if not {'u', 'v'}.issubset(gdf_edges.index.names) or 'length' not in gdf_edges.columns:
+            return gdf_edges
+        u = gdf_edges.index.get_level_values('u').to_numpy()
+        v = gdf_edges.index.get_level_values('v').to_numpy()
+        # A simplified edge lists its ways in the order it runs along them
+        ways = gdf_edges['osmid'].map(lambda x: tuple(sorted(x)) if isinstance(x, list) else (x,))
+        edges = pd.DataFrame({'a': np.minimum(u, v), 'b': np.maximum(u, v), 'ways': ways.to_numpy(),
+                              'length': np.round(gdf_edges['length'].to_numpy(dtype=float), 2)})
+        return gdf_edges[~edges.duplicated().to_numpy()]
 
+    def save_data(self, all_roads_gdf):
         if not all_roads_gdf.empty:
             output_path = Path(self.output_dir) / self.output_filename
-            all_roads_gdf.to_file(output_path, driver='ESRI Shapefile')
+            # The compact edges are converted back to a GeoDataFrame one chunk at a time while written
+            write_chunks(iter_chunks(all_roads_gdf), str(output_path), driver='ESRI Shapefile', crs=self.compact_crs)
+            projected_crs = load_aoi(self.geojson_path).projected_crs
+            for scale, variant in generalized_variants(all_roads_gdf, self.generalized_scales, projected_crs, self.compact_crs):
+                write_chunks(iter_chunks(variant), scale_filename(output_path, scale), driver='ESRI Shapefile', crs=self.compact_crs)
             print(f"Data saved successfully to {output_path}")
         else:
             print("No data to save.")
@@ -1,7 +1,9 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids
 
 class OSMSchoolDataDownloader:
     osm_key = 'amenity'
@@ -20,14 +22,20 @@ class OSMSchoolDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/210_educ/{country_code}_educ_edu_pt_s3_osm_pp_schools.gpkg"
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags={self.osm_key: self.osm_value})
-        
+        gdf = fetch_centroids(geometry, [{self.osm_key: self.osm_value}])
+        return prune_columns(gdf, self.additional_tags)
+
+    def process_data(self, gdf):
         gdf_projected = gdf.to_crs(epsg=self.crs_project)
         gdf_projected['geometry'] = gdf_projected.geometry.centroid
         gdf = gdf_projected.to_crs(epsg=self.crs_global)
@@ -57,11 +65,13 @@ class OSMSchoolDataDownloader:
         for col in list_type_cols:
             gdf[col] = gdf[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
 
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-
         # Keep only the geometry, fclass, and the actual present tags
         columns_to_keep = ['geometry', 'fclass'] + list(actual_tags)
         gdf = gdf[columns_to_keep]
+        return gdf
+
+    def save_data(self, gdf):
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
         if not gdf.empty:
             gdf.to_file(self.output_filename, driver='GPKG')
@@ -1,7 +1,10 @@
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns, to_compact, to_geodataframe
+from layers.writer import iter_chunks, write_chunks
+from layers.fetch import geometries_from_polygon
 
 class OSMSettlementsDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
@@ -13,27 +16,36 @@ class OSMSettlementsDataDownloader:
         self.attributes = ['name', 'name:en', 'name_en']
         ox.settings.log_console = True
         ox.settings.use_cache = True
+        # CRS of the compact frame, set by fetch_data
+        self.compact_crs = None
         self.output_filename = f"data/out/country_extractions/{country_code}/229_stle/{country_code}_stle_stl_pt_s3_osm_pp_settlements.shp"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the region of interest geometry
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Ensure the geometry is appropriate
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download settlements data
-        gdf_settlements = ox.geometries_from_polygon(geometry, tags=self.tags)
+        gdf_settlements = geometries_from_polygon(geometry, tags=self.tags)
+        # Held compact (categorical/Arrow tags, WKB geometries) until processing, e.g. while queued in the pipeline
+        self.compact_crs = gdf_settlements.crs
+        return to_compact(prune_columns(gdf_settlements, self.attributes + list(self.tags)))
 
+    def process_data(self, gdf_settlements):
+        gdf_settlements = to_geodataframe(gdf_settlements, self.compact_crs)
         # Ensure unique column names and presence of required fields
         gdf_settlements = self.add_required_fields(gdf_settlements)
         gdf_settlements = self.process_geometries(gdf_settlements)
         gdf_settlements = self.ensure_unique_column_names(gdf_settlements)
-
-        # Save the processed data
-        self.save_data(gdf_settlements)
+        return gdf_settlements
 
 
     def process_geometries(self, gdf):
@@ -89,6 +101,6 @@ class OSMSettlementsDataDownloader:
 
         # Attempt to save the GeoDataFrame
         try:
-            gdf.to_file(self.output_filename, driver='ESRI Shapefile')
+            write_chunks(iter_chunks(gdf), self.output_filename, driver='ESRI Shapefile')
         except Exception as e:
             print(f"An error occurred while saving the GeoDataFrame: {e}")
\ No newline at end of file
@@ -1,10 +1,15 @@
 
 import os
 import osmnx as ox
-import geopandas as gpd
 import pandas as pd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import fetch_centroids, tags_to_filters
 
 class OSMEducationDataDownloader:
+    # Taken from the school layer's data when it runs too
+    derived_from = '4'
+
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.crs_project = crs_project
@@ -15,17 +20,23 @@ class OSMEducationDataDownloader:
         self.output_filename = f"data/out/country_extractions/{country_code}/210_educ/{country_code}_educ_edu_pt_s3_osm_pp_university.gpkg"
 
     def download_and_process_data(self):
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
         # Load the AOI from the GeoJSON file
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         # Check if the geometry is a Polygon or MultiPolygon
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
         # Download data from OSM based on the provided tags and the geometry of the AOI
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
+        gdf = fetch_centroids(geometry, tags_to_filters(self.osm_tags))
+        return prune_columns(gdf, self.attributes + list(self.osm_tags))
 
+    def process_data(self, gdf):
         # Convert to the projected CRS to calculate centroids
         gdf_projected = gdf.to_crs(epsg=self.crs_project)
         gdf_projected['geometry'] = gdf_projected['geometry'].centroid
@@ -41,9 +52,6 @@ class OSMEducationDataDownloader:
         for col in list_type_cols:
             gdf[col] = gdf[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
 
-        # Make directories if they don't exist
-        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
-        
         actual_tags = gdf.columns.intersection(self.attributes)
         missing_tags = set(self.attributes) - set(actual_tags)
         if missing_tags:
@@ -53,7 +61,8 @@ class OSMEducationDataDownloader:
         columns_to_keep = ['geometry', 'fclass'] + list(actual_tags)   
         gdf = gdf[columns_to_keep]
 
-        gdf = self.ensure_unique_column_names(gdf)  
+        gdf = self.ensure_unique_column_names(gdf)
+        return gdf
 
     def ensure_unique_column_names(self, gdf):
         # Truncate column names and ensure uniqueness
@@ -66,6 +75,11 @@ class OSMEducationDataDownloader:
             else:
                 unique_columns[col_truncated] = 1
             gdf.rename(columns={col: col_truncated}, inplace=True)
+        return gdf
+
+    def save_data(self, gdf):
+        # Make directories if they don't exist
+        os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
 
         # Save the data to a GeoPackage
         if not gdf.empty:
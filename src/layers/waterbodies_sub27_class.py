@@ -1,28 +1,45 @@
 import os
 import osmnx as ox
-import geopandas as gpd
+from layers.aoi import load_aoi
+from layers.columns import prune_columns
+from layers.fetch import geometries_from_polygon
+from layers.generalize import generalized_variants, scale_filename
+from layers.geometry import dissolve_touching, repair_geometries
 
 class OSMLakeDataDownloader:
     def __init__(self, geojson_path, crs_project, crs_global, country_code):
         self.geojson_path = geojson_path
         self.output_filename = f"data/out/country_extractions/{country_code}/221_phys/{country_code}_phys_lak_py_s3_osm_pp_lake.shp"
+        # Coarser scales also written, each simplified from the full-detail frame
+        self.generalized_scales = ['s4']
         self.crs_project = crs_project
         self.crs_global = crs_global
         self.osm_tags = {'water': ['lake', 'reservoir']}
         self.attributes = ['name', 'name:en', 'name_en']
+        # Optionally merge touching polygons of the same class and name into one feature (--dissolve)
+        self.dissolve = False
+        self.dissolve_by = ['fclass', 'name']
         ox.config(log_console=True, use_cache=True)
 
     def download_and_process_data(self):
-        region_gdf = gpd.read_file(self.geojson_path)
-        geometry = region_gdf['geometry'].iloc[0]
+        gdf = self.fetch_data()
+        gdf = self.process_data(gdf)
+        self.save_data(gdf)
+
+    def fetch_data(self):
+        geometry = load_aoi(self.geojson_path, self.crs_project).query
 
         if geometry.geom_type not in ['Polygon', 'MultiPolygon']:
             raise ValueError("Geometry type not supported. Please provide a Polygon or MultiPolygon.")
 
-        gdf = ox.geometries_from_polygon(geometry, tags=self.osm_tags)
-        
+        gdf = geometries_from_polygon(geometry, tags=self.osm_tags)
+        return prune_columns(gdf, self.attributes + list(self.osm_tags))
+
+    def process_data(self, gdf):
         # Filter for polygon geometries
         gdf_polygons = gdf[gdf.geometry.type.isin(['Polygon', 'MultiPolygon'])]
+        # Lake relations often come back as invalid multipolygons; repair them in bulk before any other step
+        gdf_polygons, self.metrics = repair_geometries(gdf_polygons)
 
         if self.crs_project:
             gdf_polygons = gdf_polygons.to_crs(epsg=self.crs_project)
@@ -30,9 +47,11 @@ class OSMLakeDataDownloader:
         gdf_polygons = gdf_polygons.to_crs(epsg=self.crs_global)
 
         gdf_polygons = self.process_list_fields(gdf_polygons)
+        if self.dissolve:
+            gdf_polygons, dissolved = dissolve_touching(gdf_polygons, self.dissolve_by)
+            self.metrics.update(dissolved)
         gdf_polygons = self.ensure_unique_column_names(gdf_polygons)
-
-        self.save_data(gdf_polygons)
+        return gdf_polygons
 
     def process_list_fields(self, gdf):
         for col in gdf.columns:
@@ -69,5 +88,8 @@ class OSMLakeDataDownloader:
         os.makedirs(os.path.dirname(self.output_filename), exist_ok=True)
         try:
             gdf.to_file(self.output_filename, driver='ESRI Shapefile')
+            # Simplified copies for small-scale maps, from the same frame
+            for scale, variant in generalized_variants(gdf, self.generalized_scales, load_aoi(self.geojson_path, self.crs_project).projected_crs):
+                variant.to_file(scale_filename(self.output_filename, scale), driver='ESRI Shapefile')
         except Exception as e:
             print(f"An error occurred while saving the GeoDataFrame: {e}")
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+from layers.columns import to_geodataframe
+
+# Rows written per append; every chunk is written (and committed) by its own to_file call
+CHUNK_SIZE = 50000
+
+# Drivers by file extension. Only drivers that can append are listed: every chunk after the first
+# is appended, which GDAL's FlatGeobuf driver, for one, cannot do.
+DRIVERS = {
+    '.shp': 'ESRI Shapefile',
+    '.gpkg': 'GPKG',
+}
+
+
+# Split a frame (GeoDataFrame or compact frame) into row slices of at most 'chunk_size'. The frame
+# itself is already in memory; slicing a compact frame only bounds how much of it is expanded to
+# shapely geometries and object columns at once in 'write_chunks'.
+def iter_chunks(gdf, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(gdf), chunk_size):
+        yield gdf.iloc[start:start + chunk_size]
+
+
+# Stream an iterator of GeoDataFrame chunks into a single output file. The first non-empty
+# chunk creates (or overwrites) the file and every following chunk is appended in its own
+# transaction. Compact chunks are converted to a GeoDataFrame in 'crs' one at a time; a generator
+# that fetches or builds its chunks lazily keeps only one of them in memory.
+# Returns the number of features written.
+def write_chunks(chunks, output_filename, driver=None, crs=None):
+    if driver is None:
+        driver = DRIVERS[os.path.splitext(output_filename)[1].lower()]
+    os.makedirs(os.path.dirname(output_filename) or '.', exist_ok=True)
+
+    written = 0
+    for chunk in chunks:
+        chunk = to_geodataframe(chunk, crs)
+        if chunk.empty:
+            continue
+        chunk.to_file(output_filename, driver=driver, mode='w' if written == 0 else 'a')
+        written += len(chunk)
+    return written
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+CHECKPOINT_FILE = 'data/checkpoint.jsonl'
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Append-only journal of finished work units, one JSON line per unit with the hashes of the files it
+# wrote. A unit is identified by a key tuple, e.g. (country, layer). Every line is flushed to disk
+# before the next unit starts, so after a crash the journal holds everything that finished; a line
+# cut short by the crash is ignored.
+class Checkpoint:
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[tuple(entry['key'])] = entry
+
+    # Forget all finished work, for a run that starts from scratch
+    def clear(self):
+        self.entries = {}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        open(self.path, 'w').close()
+
+    def record(self, key, files):
+        entry = {'key': list(key), 'files': {path: file_hash(path) for path in files}, 'finished_at': time.time()}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[tuple(key)] = entry
+
+    # True when the unit finished and the files it wrote are still there, unchanged
+    def completed(self, key):
+        entry = self.entries.get(tuple(key))
+        # A unit that wrote nothing cannot be validated, so it runs again
+        if entry is None or not entry['files']:
+            return False
+        for path, digest in entry['files'].items():
+            if not os.path.exists(path) or file_hash(path) != digest:
+                logging.info(f"Output {path} of {'/'.join(map(str, key))} is missing or changed, running it again")
+                return False
+        return True
@@ -0,0 +1,150 @@
+import logging
+import pandas as pd
+from layers import fetch, registry
+from runner.scheduling import country_code
+from runner.splitter import record_queries
+
+# Derived layers: a layer class whose 'derived_from' names another layer key (e.g. hospitals from
+# health facilities, ATMs from banks) does not query OSM itself when its parent runs for the same
+# country. The parent's query is widened by the child's filters, so one request covers both, and
+# the child's fetch is answered from the parent's frame in memory with the child's own filters.
+# Jobs are ordered so a parent is fetched before its children; its frame is dropped once the last
+# child of that country has been fetched. Only the single-process pipeline shares frames this way.
+
+
+# Source for the parent's fetch: queries the previous source with the children's filters added,
+# keeps the wider result and hands the parent only the rows of its own filters
+class _Widened:
+    def __init__(self, previous, extra_filters, frames):
+        self.previous = previous
+        self.extra_filters = extra_filters
+        self.frames = frames
+
+    def _keep(self, gdf, filters):
+        self.frames.append(gdf)
+        return gdf[fetch.match_filters(gdf, filters)] if not gdf.empty else gdf
+
+    def geometries_from_polygon(self, polygon, tags):
+        with fetch.use_source(self.previous):
+            gdf = fetch.geometries_from_polygon(polygon, fetch.merge_tags(fetch.tags_to_filters(tags) + self.extra_filters))
+        return self._keep(gdf, fetch.tags_to_filters(tags))
+
+    def fetch_features(self, polygon, filters):
+        with fetch.use_source(self.previous):
+            gdf = fetch.fetch_features(polygon, filters + self.extra_filters)
+        return self._keep(gdf, filters)
+
+    def fetch_centroids(self, polygon, filters):
+        with fetch.use_source(self.previous):
+            gdf = fetch.fetch_centroids(polygon, filters + self.extra_filters)
+        return self._keep(gdf, filters)
+
+    # Not widened: the children's rows would only be those near the same features
+    def fetch_centroids_near(self, polygon, filters, near_filters, distance):
+        with fetch.use_source(self.previous):
+            return fetch.fetch_centroids_near(polygon, filters, near_filters, distance)
+
+    def edges_from_polygon(self, polygon, network_type):
+        with fetch.use_source(self.previous):
+            return fetch.edges_from_polygon(polygon, network_type)
+
+
+# Source for a child's fetch: the rows of the parent's frame matching the child's filters
+class _FromParent:
+    def __init__(self, frames):
+        frame = pd.concat(frames)
+        self.frame = frame[~frame.index.duplicated()]
+
+    def _select(self, filters):
+        if self.frame.empty:
+            return self.frame
+        gdf = self.frame[fetch.match_filters(self.frame, filters)]
+        # Only the tags the child's own query would have returned
+        return gdf.dropna(axis=1, how='all')
+
+    def geometries_from_polygon(self, polygon, tags):
+        return self._select(fetch.tags_to_filters(tags))
+
+    def fetch_features(self, polygon, filters):
+        return self._select(filters)
+
+    def fetch_centroids(self, polygon, filters):
+        return self._select(filters)
+
+    def fetch_centroids_near(self, polygon, filters, near_filters, distance):
+        raise ValueError("Features near other features cannot be derived from another layer")
+
+    def edges_from_polygon(self, polygon, network_type):
+        raise ValueError("Street networks cannot be derived from another layer")
+
+
+class DerivedLayers:
+    def __init__(self, jobs, create_downloader):
+        self.create_downloader = create_downloader
+        planned = {(country_code(geojson_file), layer) for geojson_file, layer in jobs}
+        # (country, parent layer) -> child layers still to be fetched
+        self.children = {}
+        for geojson_file, layer in jobs:
+            parent = getattr(registry.get_layer_class(layer), 'derived_from', None)
+            if parent is not None and (country_code(geojson_file), parent) in planned:
+                self.children.setdefault((country_code(geojson_file), parent), []).append(layer)
+        self.parent_of = {child: parent for (_, parent), children in self.children.items() for child in children}
+        self.filters = {}
+        self.frames = {}
+
+    # The jobs in their given order, except that a parent moves up to just before its first child
+    def order(self, jobs):
+        by_key = {(country_code(geojson_file), layer): (geojson_file, layer) for geojson_file, layer in jobs}
+        ordered = []
+        placed = set()
+        for geojson_file, layer in jobs:
+            key = (country_code(geojson_file), layer)
+            parent = (key[0], self.parent_of.get(layer))
+            if parent in self.children and layer in self.children[parent] and parent not in placed:
+                ordered.append(by_key[parent])
+                placed.add(parent)
+            if key not in placed:
+                ordered.append((geojson_file, layer))
+                placed.add(key)
+        return ordered
+
+    # The filters a child layer queries, recorded once per layer
+    def child_filters(self, geojson_file, layer):
+        if layer not in self.filters:
+            self.filters[layer], _ = record_queries([self.create_downloader(geojson_file, layer)])
+        return self.filters[layer]
+
+    def _parent_fetch(self, key, geojson_file, fetch_data):
+        extra_filters = [f for child in self.children[key] for f in self.child_filters(geojson_file, child)]
+
+        def widened_fetch():
+            frames = []
+            with fetch.use_source(_Widened(fetch.current_source(), extra_filters, frames)):
+                data = fetch_data()
+            self.frames[key] = frames
+            return data
+        return widened_fetch
+
+    def _child_fetch(self, key, layer, fetch_data):
+        def derived_fetch():
+            frames = self.frames.get(key)
+            self.children[key].remove(layer)
+            if not self.children[key]:
+                self.frames.pop(key, None)
+            # The parent's fetch failed or came back without any data: query as usual
+            if not frames:
+                return fetch_data()
+            logging.info(f"Deriving layer {layer} of {key[0]} from layer {key[1]}")
+            with fetch.use_source(_FromParent(frames)):
+                return fetch_data()
+        return derived_fetch
+
+    # Route the fetches of the (job, downloader) pairs through their parent or child role
+    def attach(self, downloaders):
+        for (geojson_file, layer), downloader in downloaders:
+            country = country_code(geojson_file)
+            if (country, layer) in self.children:
+                downloader.fetch_data = self._parent_fetch((country, layer), geojson_file, downloader.fetch_data)
+            elif (country, self.parent_of.get(layer)) in self.children:
+                downloader.fetch_data = self._child_fetch((country, self.parent_of[layer]), layer, downloader.fetch_data)
+            yield (geojson_file, layer), downloader
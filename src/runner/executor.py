@@ -0,0 +1,113 @@
+import logging
+import queue
+import threading
+import time
+from layers import osm_cache
+
+# Marks the end of the job stream between two stages
+_DONE = object()
+
+
+# Run downloaders as a three-stage pipeline: 'fetch_data' for the next job runs on an I/O
+# thread while the current job's 'process_data' runs on the calling thread and the previous
+# job's 'save_data' runs on a writer thread. The bounded queues between the stages keep at
+# most 'queue_size' fetched and 'queue_size' processed layers in memory, so a slow stage holds
+# the others back instead of letting frames pile up.
+#
+# 'jobs' yields (job, downloader) pairs, where 'job' identifies the work (e.g. a (geojson path,
+# layer) tuple); it may be lazy and is consumed on the fetch thread. After a job is written,
+# 'on_complete(job, downloader, metrics)' is called with the seconds spent in each stage
+# ('fetch_seconds', 'process_seconds', 'write_seconds'), the osmnx cache hits and misses of its
+# fetch, its feature count and the counts the downloader put in its 'metrics' attribute while
+# processing; when a stage fails, the error is logged,
+# 'on_error(job, downloader, stage, error, metrics)' is called with the metrics gathered so far
+# and the other jobs carry on. 'before_write(job, downloader)' is called just before a job is
+# written, e.g. to remove its earlier outputs. The callbacks may run on any stage's thread but never
+# at the same time, so they can share state without locking of their own.
+def run_pipelined(jobs, queue_size=1, on_complete=None, on_error=None, before_write=None):
+    fetched = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    # Serialises the callbacks, which are called from two threads
+    callback_lock = threading.Lock()
+
+    osm_cache.install()
+
+    def failed(job, downloader, stage, error, metrics):
+        logging.error(f"Error in {downloader.__class__.__name__}: {error}")
+        if on_error is not None:
+            with callback_lock:
+                on_error(job, downloader, stage, error, metrics)
+
+    def fetch_stage():
+        try:
+            for job, downloader in jobs:
+                # Fetches run one at a time on this thread, so the cache counters' change belongs to this job
+                cache_before = osm_cache.stats()
+                started = time.perf_counter()
+                try:
+                    data = downloader.fetch_data()
+                    failure = None
+                except Exception as e:
+                    failure = e
+                cache_after = osm_cache.stats()
+                metrics = {
+                    'fetch_seconds': time.perf_counter() - started,
+                    'cache_hits': cache_after['hits'] - cache_before['hits'],
+                    'cache_misses': cache_after['misses'] - cache_before['misses'],
+                }
+                if failure is not None:
+                    failed(job, downloader, 'fetch', failure, metrics)
+                    continue
+                fetched.put((job, downloader, data, metrics))
+        except Exception as e:
+            logging.error(f"Error while creating downloaders: {e}")
+        finally:
+            fetched.put(_DONE)
+
+    def write_stage():
+        while True:
+            item = processed.get()
+            if item is _DONE:
+                break
+            job, downloader, gdf, metrics = item
+            metrics['features'] = len(gdf)
+            started = time.perf_counter()
+            try:
+                if before_write is not None:
+                    with callback_lock:
+                        before_write(job, downloader)
+                downloader.save_data(gdf)
+            except Exception as e:
+                failed(job, downloader, 'write', e, metrics)
+                continue
+            metrics['write_seconds'] = time.perf_counter() - started
+            logging.info(f"Completed: {downloader.__class__.__name__}")
+            if on_complete is not None:
+                with callback_lock:
+                    on_complete(job, downloader, metrics)
+
+    fetcher = threading.Thread(target=fetch_stage, name='fetch', daemon=True)
+    writer = threading.Thread(target=write_stage, name='write', daemon=True)
+    fetcher.start()
+    writer.start()
+
+    try:
+        while True:
+            item = fetched.get()
+            if item is _DONE:
+                break
+            job, downloader, data, metrics = item
+            started = time.perf_counter()
+            try:
+                gdf = downloader.process_data(data)
+            except Exception as e:
+                failed(job, downloader, 'process', e, metrics)
+                continue
+            metrics['process_seconds'] = time.perf_counter() - started
+            # Counts a layer reports about its own processing, e.g. repaired geometries
+            metrics.update(getattr(downloader, 'metrics', {}))
+            del data
+            processed.put((job, downloader, gdf, metrics))
+    finally:
+        processed.put(_DONE)
+        writer.join()
@@ -0,0 +1,159 @@
+import argparse
+import os
+import sqlite3
+import subprocess
+import time
+
+# Every run appends one row per (country, layer) job to this database
+HISTORY_DB = 'data/run_history.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    code_version TEXT,
+    command TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    country TEXT NOT NULL,
+    layer TEXT NOT NULL,
+    status TEXT NOT NULL,
+    failed_stage TEXT,
+    error TEXT,
+    fetch_seconds REAL,
+    process_seconds REAL,
+    write_seconds REAL,
+    total_seconds REAL,
+    features INTEGER,
+    output_bytes INTEGER,
+    cache_hits INTEGER,
+    cache_misses INTEGER,
+    invalid_geometries INTEGER,
+    repaired_geometries INTEGER,
+    dropped_geometries INTEGER,
+    dissolved_geometries INTEGER,
+    merged_lines INTEGER,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_job ON jobs (country, layer, finished_at);
+"""
+
+STAGE_COLUMNS = ['fetch_seconds', 'process_seconds', 'write_seconds']
+
+# Geometry repair, dissolve and line merge counts reported by the water layers (see layers.geometry)
+GEOMETRY_COLUMNS = ['invalid_geometries', 'repaired_geometries', 'dropped_geometries', 'dissolved_geometries',
+                    'merged_lines']
+
+
+# The git commit the code runs from, marked '-dirty' when the tree has local changes
+def code_version():
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=src_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class RunHistory:
+    def __init__(self, path=HISTORY_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Jobs are recorded from the pipeline's stage threads, one at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.run_id = None
+
+    def start_run(self, command=None):
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, code_version, command) VALUES (?, ?, ?)",
+                (time.time(), code_version(), command))
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    # Record a finished job; 'metrics' are the ones reported by runner.executor.run_pipelined
+    def record_job(self, country, layer, metrics, status='done', failed_stage=None, error=None, output_bytes=None):
+        seconds = [metrics.get(col) for col in STAGE_COLUMNS]
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO jobs (run_id, country, layer, status, failed_stage, error, fetch_seconds, process_seconds,"
+                " write_seconds, total_seconds, features, output_bytes, cache_hits, cache_misses, invalid_geometries,"
+                " repaired_geometries, dropped_geometries, dissolved_geometries, merged_lines, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, country, str(layer), status, failed_stage, None if error is None else str(error),
+                 *seconds, sum(s for s in seconds if s is not None), metrics.get('features'), output_bytes,
+                 metrics.get('cache_hits'), metrics.get('cache_misses'), *[metrics.get(col) for col in GEOMETRY_COLUMNS],
+                 time.time()))
+
+    # Expected duration of every (country, layer) job: the mean total of its last 'last' successful runs
+    def expected_durations(self, last=3):
+        rows = self.connection.execute(
+            "SELECT country, layer, AVG(total_seconds) FROM ("
+            " SELECT country, layer, total_seconds,"
+            "  ROW_NUMBER() OVER (PARTITION BY country, layer ORDER BY finished_at DESC) AS age"
+            " FROM jobs WHERE status = 'done')"
+            " WHERE age <= ? GROUP BY country, layer", (last,))
+        return {(country, layer): seconds for country, layer, seconds in rows}
+
+    # The slowest jobs, each with its most recent successful run
+    def slowest_jobs(self, limit=10):
+        return self.connection.execute(
+            "SELECT country, layer, total_seconds, fetch_seconds, process_seconds, write_seconds, features,"
+            " output_bytes FROM ("
+            " SELECT *, ROW_NUMBER() OVER (PARTITION BY country, layer ORDER BY finished_at DESC) AS age"
+            " FROM jobs WHERE status = 'done')"
+            " WHERE age = 1 ORDER BY total_seconds DESC LIMIT ?", (limit,)).fetchall()
+
+    # Recent runs of jobs, oldest first, optionally narrowed to one country and/or layer
+    def trend(self, country=None, layer=None, limit=20):
+        rows = self.connection.execute(
+            "SELECT jobs.finished_at, jobs.country, jobs.layer, jobs.status, jobs.total_seconds, jobs.features,"
+            " jobs.output_bytes, jobs.cache_hits, runs.code_version FROM jobs JOIN runs USING (run_id)"
+            " WHERE (? IS NULL OR jobs.country = ?) AND (? IS NULL OR jobs.layer = ?)"
+            " ORDER BY jobs.finished_at DESC LIMIT ?", (country, country, layer, layer, limit)).fetchall()
+        return rows[::-1]
+
+    def failures(self, limit=20):
+        return self.connection.execute(
+            "SELECT finished_at, country, layer, failed_stage, error FROM jobs WHERE status = 'failed'"
+            " ORDER BY finished_at DESC LIMIT ?", (limit,)).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+def _format_table(header, rows):
+    rows = [['' if value is None else f"{value:.2f}" if isinstance(value, float) else str(value) for value in row]
+            for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    lines = ['  '.join(str(cell).ljust(width) for cell, width in zip(header, widths))]
+    lines += ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    return '\n'.join(lines)
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(seconds))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report on the recorded run history")
+    parser.add_argument("report", choices=['slowest', 'trend', 'failures'])
+    parser.add_argument("--db", default=HISTORY_DB)
+    parser.add_argument("--country")
+    parser.add_argument("--layer")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    history = RunHistory(args.db)
+    if args.report == 'slowest':
+        print(_format_table(['country', 'layer', 'total_s', 'fetch_s', 'process_s', 'write_s', 'features', 'bytes'],
+                            history.slowest_jobs(args.limit)))
+    elif args.report == 'trend':
+        rows = [(_timestamp(finished_at), *rest) for finished_at, *rest in history.trend(args.country, args.layer, args.limit)]
+        print(_format_table(['finished', 'country', 'layer', 'status', 'total_s', 'features', 'bytes', 'cache_hits',
+                             'version'], rows))
+    else:
+        rows = [(_timestamp(finished_at), *rest) for finished_at, *rest in history.failures(args.limit)]
+        print(_format_table(['finished', 'country', 'layer', 'stage', 'error'], rows))
+    history.close()
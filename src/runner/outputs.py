@@ -0,0 +1,43 @@
+import glob
+import os
+from layers.generalize import scale_filename
+
+# Sidecar files written next to a shapefile
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+# Path of the file a downloader writes. Most layers keep it in 'output_filename'; the road and
+# railway layers split it into 'output_dir' and 'output_filename'.
+def output_path(downloader):
+    output_filename = str(downloader.output_filename)
+    if hasattr(downloader, 'output_dir'):
+        return os.path.join(downloader.output_dir, output_filename)
+    return output_filename
+
+
+def _files(path):
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == '.shp':
+        return sorted(f for f in glob.glob(f"{glob.escape(stem)}.*") if os.path.splitext(f)[1].lower() in SHAPEFILE_PARTS)
+    return [path] if os.path.exists(path) else []
+
+
+# Every file that makes up a downloader's output on disk, for a shapefile including its sidecars
+# and for a generalised layer including its other scales
+def output_files(downloader):
+    path = output_path(downloader)
+    files = _files(path)
+    for scale in getattr(downloader, 'generalized_scales', []):
+        files += _files(scale_filename(path, scale))
+    return files
+
+
+# Remove a downloader's outputs of an earlier run. Most layers only print the errors of their
+# 'save_data', so a failed write would otherwise leave the old files in place to be journalled.
+def remove_outputs(downloader):
+    for path in output_files(downloader):
+        os.remove(path)
+
+
+def output_bytes(downloader):
+    return sum(os.path.getsize(f) for f in output_files(downloader))
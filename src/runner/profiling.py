@@ -0,0 +1,145 @@
+import collections
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from functools import lru_cache
+
+# Profiling of layer runs (--profile): every stage of a job runs under cProfile, for exact call
+# counts and per-function times, while a sampling thread records the stage's call stack every
+# SAMPLE_INTERVAL, for flame graphs. Each job leaves '<country>-<layer>.pstats' (for pstats,
+# snakeviz, ...) and '<country>-<layer>.collapsed' (folded stacks for flamegraph.pl or speedscope)
+# in PROFILE_DIR.
+PROFILE_DIR = 'data/profiles'
+
+# Seconds between two stack samples of a running stage
+SAMPLE_INTERVAL = 0.005
+
+# Functions listed in the summary
+TOP_FUNCTIONS = 25
+
+# Packages the summary attributes time to; functions of any other module count as 'other'
+PACKAGES = ['osmnx', 'geopandas', 'shapely', 'pandas', 'numpy', 'pyproj', 'pyogrio', 'fiona', 'requests', 'networkx',
+            'layers', 'runner']
+
+STAGES = ['fetch_data', 'process_data', 'save_data']
+
+# The pipeline runs stages of different jobs on different threads. Before Python 3.12, cProfile
+# only hooks the thread that enables it, so every stage is profiled on its own thread while the
+# others run alongside, as in an unprofiled run. From 3.12 on, cProfile uses sys.monitoring, which
+# allows one active profiler per process: the profiled stages then take turns, so the profiles show
+# a pipeline without overlap, and the summary says so.
+CONCURRENT_PROFILES = sys.version_info < (3, 12)
+_lock = threading.Lock()
+
+
+# Dotted module name of a source file, relative to the sys.path entry it was imported from
+@lru_cache(maxsize=None)
+def module_name(filename):
+    if filename.startswith('<frozen '):
+        return filename[len('<frozen '):-1]
+    if filename.startswith('<') or filename == '~':
+        return 'builtins'
+    path = os.path.abspath(filename)
+    roots = sorted((os.path.abspath(p) for p in sys.path if p), key=len, reverse=True)
+    for root in roots:
+        if path.startswith(root + os.sep):
+            path = os.path.relpath(path, root)
+            break
+    module = os.path.splitext(path)[0].replace(os.sep, '.')
+    return module[:-len('.__init__')] if module.endswith('.__init__') else module
+
+
+def package_name(filename):
+    package = module_name(filename).split('.')[0]
+    return package if package in PACKAGES or package == 'builtins' else 'other'
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id, root_code, stacks):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.stacks = stacks
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            # Up to the profiled stage; the pipeline's own frames below it are left out
+            while frame is not None and frame.f_code is not self.root_code:
+                names.append(f"{module_name(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+class JobProfiler:
+    def __init__(self, country, layer, profile_dir=PROFILE_DIR):
+        self.path = os.path.join(profile_dir, f"{country}-{layer}")
+        self.profile = cProfile.Profile()
+        self.stacks = collections.Counter()
+
+    # Run a downloader's stages under this profiler, whichever thread calls them
+    def attach(self, downloader):
+        for stage in STAGES:
+            setattr(downloader, stage, self._wrap(getattr(downloader, stage)))
+        return downloader
+
+    def _wrap(self, method):
+        def profiled(*args, **kwargs):
+            with contextlib.nullcontext() if CONCURRENT_PROFILES else _lock:
+                sampler = _Sampler(threading.get_ident(), profiled.__code__, self.stacks)
+                sampler.start()
+                self.profile.enable()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.profile.disable()
+                    sampler.stopped.set()
+                    sampler.join()
+        return profiled
+
+    # Write the job's pstats and collapsed stack files; returns the pstats path
+    def dump(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.profile.dump_stats(f"{self.path}.pstats")
+        with open(f"{self.path}.collapsed", 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return f"{self.path}.pstats"
+
+
+# The hottest functions across the given pstats files by their own time, and the time per package
+def summarize(paths, top=TOP_FUNCTIONS):
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return "No profiles recorded."
+    stats = pstats.Stats(*paths)
+    functions = []
+    packages = collections.Counter()
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        package = package_name(filename)
+        packages[package] += own
+        label = name if package == 'builtins' else f"{module_name(filename)}:{name}:{line}"
+        functions.append((own, cumulative, calls, package, label))
+    functions.sort(reverse=True)
+
+    total = sum(packages.values()) or 1
+    lines = []
+    if not CONCURRENT_PROFILES:
+        lines.append("Warning: on this Python version the profiled stages ran one at a time, without the pipeline's overlap")
+    lines.append(f"Profiled {len(paths)} jobs, {stats.total_tt:.1f} s; own time per package:")
+    lines += [f"  {package:<10} {seconds:9.2f} s {100 * seconds / total:5.1f}%" for package, seconds in packages.most_common()]
+    lines.append(f"Top {min(top, len(functions))} functions by own time:")
+    lines.append(f"  {'own s':>9} {'cum s':>9} {'calls':>10}  {'package':<10} function")
+    lines += [f"  {own:9.2f} {cumulative:9.2f} {calls:10d}  {package:<10} {label}" for own, cumulative, calls, package, label in functions[:top]]
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    # Summarise profiles written by earlier runs, e.g. 'python -m runner.profiling data/profiles/*.pstats'
+    print(summarize(sys.argv[1:] or sorted(os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.pstats'))))
@@ -0,0 +1,64 @@
+import os
+
+from pyproj import Geod
+from layers.aoi import load_aoi
+
+_geod = Geod(ellps='WGS84')
+
+
+def country_code(geojson_path):
+    return os.path.basename(geojson_path).split('.')[0]
+
+
+# Size of the AOI as its geodesic area in km²
+def aoi_size(geojson_path):
+    geometry = load_aoi(geojson_path).union
+    return abs(_geod.geometry_area_perimeter(geometry)[0]) / 1e6
+
+
+# Order (geojson path, layer) jobs longest first. 'durations' maps (country, layer) to expected
+# seconds, see runner.history.RunHistory.expected_durations. A job's cost is its expected
+# duration; a job without history is estimated from its AOI size times the layer's recorded
+# seconds per km² (or, for a layer that never ran, the mean over all layers). With no history at all the jobs are
+# ordered by AOI size alone; an AOI whose area cannot be computed counts as 0 km². Running the
+# biggest jobs first lets small ones fill the gaps at the end of the run when jobs run side by
+# side, on the workers of a queue (--queue); in a single pipeline, where jobs run one after
+# another, the order hardly changes the total time.
+def order_jobs(jobs, durations):
+    sizes = {}
+
+    def size(geojson_path):
+        if geojson_path not in sizes:
+            try:
+                sizes[geojson_path] = aoi_size(geojson_path)
+            except Exception:
+                sizes[geojson_path] = 0
+        return sizes[geojson_path]
+
+    rates = {}
+    for geojson_path, layer in jobs:
+        seconds = durations.get((country_code(geojson_path), layer))
+        if seconds is not None and size(geojson_path) > 0:
+            rates.setdefault(layer, []).append(seconds / size(geojson_path))
+    all_rates = [rate for layer_rates in rates.values() for rate in layer_rates]
+    default_rate = sum(all_rates) / len(all_rates) if all_rates else 1
+
+    def cost(job):
+        geojson_path, layer = job
+        seconds = durations.get((country_code(geojson_path), layer))
+        if seconds is not None:
+            return seconds
+        layer_rates = rates.get(layer)
+        rate = sum(layer_rates) / len(layer_rates) if layer_rates else default_rate
+        return size(geojson_path) * rate
+
+    return sorted(jobs, key=cost, reverse=True)
+
+
+# Keep the jobs of each country together, countries in the order of their first job. With an
+# extract, a country's split is then read once for all of its layers.
+def group_by_country(jobs):
+    countries = {}
+    for job in jobs:
+        countries.setdefault(country_code(job[0]), []).append(job)
+    return [job for country_jobs in countries.values() for job in country_jobs]
@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import re
+import shutil
+from functools import lru_cache
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from osmnx import _overpass, features
+from layers import fetch
+from layers.aoi import load_aoi
+from runner.scheduling import country_code
+
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+# Global mode: instead of one Overpass query per country and layer, read a planet or continent
+# extract once, keep the elements any layer asks for, assign each to every country whose AOI it
+# intersects and spill them per country. The layers then run unchanged against an ExtractSource
+# that answers their queries from the split, so the cost of the read grows with the extract, not
+# with the number of countries times the extract. pyosmium reads the file twice for that: a first
+# pass collects the members of multipolygon relations, so the second can assemble their areas.
+
+SPLIT_DIR = 'data/split'
+
+# Matched elements are assigned to countries and written out in batches of this many
+BATCH_SIZE = 100000
+
+# Parsed country splits kept in memory. Only the pipeline's fetch stage queries the source, one job
+# at a time, and the jobs of a country run together (scheduling.group_by_country), so one is enough.
+CACHED_COUNTRIES = 1
+
+_FILTER_CLAUSE = re.compile(r'\["([^"]+)"(?:(!?~)"([^"]*)")?\]')
+
+
+# Layers describe their queries only through the calls their 'fetch_data' makes, so run it once
+# against a source that records the queries and answers them with nothing
+class _QueryRecorder:
+    def __init__(self):
+        self.filters = []
+        self.network_types = []
+
+    def geometries_from_polygon(self, polygon, tags):
+        self.filters.extend(fetch.tags_to_filters(tags))
+        return gpd.GeoDataFrame(geometry=[], crs=4326)
+
+    def fetch_features(self, polygon, filters):
+        self.filters.extend(filters)
+        return gpd.GeoDataFrame(geometry=[], crs=4326)
+
+    def fetch_centroids(self, polygon, filters):
+        return self.fetch_features(polygon, filters)
+
+    def fetch_centroids_near(self, polygon, filters, near_filters, distance):
+        return self.fetch_features(polygon, filters + near_filters)
+
+    def edges_from_polygon(self, polygon, network_type):
+        self.network_types.append(network_type)
+        return gpd.GeoDataFrame(geometry=[], crs=4326)
+
+
+# The tag filters and street network types the given downloaders query
+def record_queries(downloaders):
+    recorder = _QueryRecorder()
+    with fetch.use_source(recorder):
+        for downloader in downloaders:
+            downloader.fetch_data()
+    return recorder.filters, list(dict.fromkeys(recorder.network_types))
+
+
+def _value_matches(value, wanted):
+    if wanted is True:
+        return True
+    if isinstance(wanted, str):
+        return value == wanted
+    return value in wanted
+
+
+# Predicate on a tags dict that is true when all tags of at least one filter are present
+def filter_predicate(filters):
+    keys = {key for tags in filters for key in tags}
+
+    def matches(tags):
+        if keys.isdisjoint(tags):
+            return False
+        return any(all(key in tags and _value_matches(tags[key], wanted) for key, wanted in f.items()) for f in filters)
+    return matches
+
+
+# osmnx's Overpass filter of a street network type, e.g. '["highway"]["area"!~"yes"]...', as a
+# predicate on a tags dict
+def network_predicate(network_type):
+    clauses = [(key, op, re.compile(pattern)) for key, op, pattern in _FILTER_CLAUSE.findall(_overpass._get_osm_filter(network_type))]
+
+    def matches(tags):
+        for key, op, pattern in clauses:
+            value = tags.get(key)
+            if op == '':
+                if value is None:
+                    return False
+            elif op == '~':
+                if value is None or not pattern.search(value):
+                    return False
+            elif value is not None and pattern.search(value):
+                return False
+        return True
+    return matches
+
+
+class _ExtractHandler(osmium.SimpleHandler if osmium is not None else object):
+    def __init__(self, matches, on_batch):
+        super().__init__()
+        self.matches = matches
+        self.on_batch = on_batch
+        self.wkb_factory = osmium.geom.WKBFactory()
+        self.batch = []
+
+    def add(self, element_type, osmid, tags, geometry):
+        self.batch.append((element_type, osmid, tags, geometry))
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.on_batch(self.batch)
+            self.batch = []
+
+    # pyosmium reuses its objects after a callback returns, so everything is copied out here
+    def node(self, n):
+        if len(n.tags) == 0:
+            return
+        tags = {tag.k: tag.v for tag in n.tags}
+        if self.matches(tags) and n.location.valid():
+            self.add('node', n.id, tags, shapely.Point(n.location.lon, n.location.lat))
+
+    def way(self, w):
+        tags = {tag.k: tag.v for tag in w.tags}
+        if not tags or not self.matches(tags):
+            return
+        try:
+            coords = [(node.lon, node.lat) for node in w.nodes]
+        except osmium.InvalidLocationError:
+            return
+        if len(coords) < 2:
+            return
+        # Closed ways become polygons by osmnx's rules, so both sources agree on the geometry type
+        if w.is_closed() and len(coords) >= 4 and features._is_closed_way_a_polygon({'tags': tags}):
+            geometry = shapely.Polygon(coords)
+        else:
+            geometry = shapely.LineString(coords)
+        self.add('way', w.id, tags, geometry)
+
+    def area(self, a):
+        # Areas built from closed ways were handled in 'way'; only the multipolygon relations are left
+        if a.from_way():
+            return
+        tags = {tag.k: tag.v for tag in a.tags}
+        if not tags or not self.matches(tags):
+            return
+        try:
+            geometry = shapely.from_wkb(self.wkb_factory.create_multipolygon(a))
+        except RuntimeError:
+            return
+        self.add('relation', a.orig_id(), tags, geometry)
+
+
+# Read the extract (.osm.pbf, .osm or .osm.bz2) and split the elements matching 'filters' or
+# one of 'network_types' into the countries of 'geojson_paths'. Returns an ExtractSource over the split.
+def split_extract(extract_path, geojson_paths, filters, network_types=(), split_dir=SPLIT_DIR):
+    if osmium is None:
+        raise ImportError("Reading OSM extracts requires pyosmium (pip install osmium)")
+
+    aois = {country_code(path): load_aoi(path).union for path in geojson_paths}
+    countries = list(aois)
+    tree = shapely.STRtree(list(aois.values()))
+    for country in countries:
+        shutil.rmtree(os.path.join(split_dir, country), ignore_errors=True)
+        os.makedirs(os.path.join(split_dir, country))
+
+    predicates = [filter_predicate(filters)] + [network_predicate(network_type) for network_type in network_types]
+    counts = dict.fromkeys(countries, 0)
+    part = [0]
+
+    def assign(batch):
+        element_types, osmids, tags, geometries = zip(*batch)
+        geometries = np.array(geometries, dtype=object)
+        # Repair invalid polygons the way osmnx does before they are tested against the AOIs
+        invalid = ~shapely.is_valid(geometries)
+        geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+
+        feature_idx, country_idx = tree.query(geometries, predicate='intersects')
+        frame = pd.DataFrame({
+            'element_type': element_types,
+            'osmid': osmids,
+            'tags': [json.dumps(t) for t in tags],
+            'geometry': shapely.to_wkb(geometries),
+        })
+        for c in np.unique(country_idx):
+            rows = frame.iloc[feature_idx[country_idx == c]]
+            rows.to_parquet(os.path.join(split_dir, countries[c], f"part-{part[0]:05d}.parquet"), index=False)
+            counts[countries[c]] += len(rows)
+        part[0] += 1
+
+    handler = _ExtractHandler(lambda tags: any(p(tags) for p in predicates), assign)
+    # Way and relation geometries need node locations; 'flex_mem' switches to a dense index for planet-sized input
+    handler.apply_file(extract_path, locations=True, idx='flex_mem')
+    handler.flush()
+    for country in countries:
+        logging.info(f"Split {counts[country]} features of {extract_path} into {country}")
+    return ExtractSource(split_dir, aois)
+
+
+# Answers the layers' queries from a split extract, restricted to the query polygon and the requested
+# tags and indexed by (element_type, osmid). The split already holds every feature intersecting a
+# country's AOI, so a job's queries only read its own country (see 'attach'), except for the near
+# features of 'fetch_centroids_near'; outside of a job, the countries the query polygon intersects are read.
+class ExtractSource:
+    def __init__(self, split_dir, aois):
+        self.split_dir = split_dir
+        self.countries = list(aois)
+        self.tree = shapely.STRtree(list(aois.values()))
+        self.country = None
+        self.read_country = lru_cache(maxsize=CACHED_COUNTRIES)(self._read_country)
+
+    # Answer the queries of each (job, downloader) pair's fetch from the job's country
+    def attach(self, downloaders):
+        for (geojson_file, layer), downloader in downloaders:
+            downloader.fetch_data = self._fetch_for(country_code(geojson_file), downloader.fetch_data)
+            yield (geojson_file, layer), downloader
+
+    def _fetch_for(self, country, fetch_data):
+        def country_fetch():
+            self.country = country
+            try:
+                return fetch_data()
+            finally:
+                self.country = None
+        return country_fetch
+
+    def _read_country(self, country):
+        directory = os.path.join(self.split_dir, country)
+        parts = sorted(f for f in os.listdir(directory) if f.endswith('.parquet')) if os.path.isdir(directory) else []
+        if not parts:
+            return None
+        frame = pd.concat([pd.read_parquet(os.path.join(directory, f)) for f in parts], ignore_index=True)
+        frame['tags'] = frame['tags'].map(json.loads)
+        return frame
+
+    def _select(self, polygon, matches, own_country=True):
+        if self.country is not None and own_country:
+            countries = [self.country]
+        else:
+            countries = [self.countries[i] for i in self.tree.query(polygon, predicate='intersects')]
+        frames = [self.read_country(country) for country in countries]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return gpd.GeoDataFrame(geometry=[], crs=4326)
+        frame = pd.concat(frames, ignore_index=True).drop_duplicates(['element_type', 'osmid'])
+        frame = frame[frame['tags'].map(matches).to_numpy()]
+
+        gdf = gpd.GeoDataFrame(
+            pd.DataFrame.from_records(frame['tags'].tolist()),
+            geometry=gpd.GeoSeries.from_wkb(frame['geometry'].tolist()).values,
+            crs=4326,
+        )
+        gdf.index = pd.MultiIndex.from_arrays([frame['element_type'].to_numpy(), frame['osmid'].to_numpy()], names=['element_type', 'osmid'])
+        return gdf.iloc[np.sort(gdf.sindex.query(polygon, predicate='intersects'))]
+
+    def geometries_from_polygon(self, polygon, tags):
+        return self._select(polygon, filter_predicate(fetch.tags_to_filters(tags)))
+
+    def fetch_features(self, polygon, filters):
+        return self._select(polygon, filter_predicate(filters))
+
+    # Centroids of the full geometries; unlike Overpass' bounding box centres they lie on the feature's mass
+    def fetch_centroids(self, polygon, filters):
+        gdf = self._select(polygon, filter_predicate(filters))
+        gdf[gdf.geometry.name] = shapely.centroid(gdf.geometry.values)
+        return gdf
+
+    # Distances are measured in the UTM zone of the candidates. Like Overpass' 'around', the near
+    # features are also looked up outside the query polygon, within 'distance' of it, from the splits
+    # of every country of the run there; reading those can push the job's own split out of the cache.
+    def fetch_centroids_near(self, polygon, filters, near_filters, distance):
+        gdf = self._select(polygon, filter_predicate(filters))
+        if gdf.empty:
+            return gdf
+        crs = gdf.estimate_utm_crs()
+        around = gpd.GeoSeries([polygon], crs=4326).to_crs(crs).buffer(distance).to_crs(4326).iloc[0]
+        near = self._select(around, filter_predicate(near_filters), own_country=False)
+        if near.empty:
+            return gdf.iloc[:0]
+        tree = shapely.STRtree(near.to_crs(crs).geometry.values)
+        found, _ = tree.query(gdf.to_crs(crs).geometry.values, predicate='dwithin', distance=distance)
+        gdf = gdf.iloc[np.unique(found)].copy()
+        gdf[gdf.geometry.name] = shapely.centroid(gdf.geometry.values)
+        return gdf
+
+    # The ways of the network as edges; unlike osmnx's graph they are not split at intersections
+    def edges_from_polygon(self, polygon, network_type):
+        gdf = self._select(polygon, network_predicate(network_type))
+        gdf = gdf[gdf.geom_type == 'LineString'].copy()
+        gdf['osmid'] = gdf.index.get_level_values('osmid')
+        return gdf
@@ -0,0 +1,283 @@
+import argparse
+import glob
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from layers.generalize import scale_filename
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+try:
+    from pmtiles.convert import mbtiles_to_pmtiles
+except ImportError:
+    mbtiles_to_pmtiles = None
+
+# Export stage: all layers written for a country go into one vector tileset (MBTiles, or PMTiles
+# when the output name ends in '.pmtiles'), so a web map loads only the tiles in view instead of
+# whole shapefiles. Features appear from the zoom their 'fclass' is given below, and each block of
+# tiles is cut, simplified and encoded in its own worker process.
+
+OUTPUT_ROOT = 'data/out/country_extractions'
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+# Tile coordinate range of the encoded geometries
+EXTENT = 4096
+# Extent units around each tile that are included, so lines and polygons meet without seams
+BUFFER = 64
+# Extent units a geometry may move when it is simplified for a zoom
+SIMPLIFY_UNITS = 2
+# Tiles are rendered in square blocks of this many tiles on a side, one block per worker task
+BLOCK_SIZE = 16
+# Blocks submitted ahead per worker; only these blocks' encoded tiles wait in memory to be written
+PENDING_BLOCKS_PER_WORKER = 2
+# Half the width of the web mercator world in metres
+ORIGIN = 20037508.342789244
+
+# First zoom at which a feature of each 'fclass' is shown
+FCLASS_MIN_ZOOM = {
+    # Roads
+    'motorway': 4, 'trunk': 5, 'primary': 6, 'secondary': 8, 'tertiary': 10,
+    'motorway_link': 10, 'trunk_link': 10, 'primary_link': 11, 'secondary_link': 12, 'tertiary_link': 12,
+    'unclassified': 11, 'residential': 12, 'road': 12, 'living_street': 13, 'service': 13, 'track': 13,
+    # Settlements
+    'national_capital': 2, 'city': 4, 'town': 7, 'suburb': 11, 'village': 10, 'hamlet': 12,
+    'isolated_dwelling': 13, 'neighbourhood': 13, 'locality': 13,
+    # Water
+    'river': 6, 'lake': 6, 'reservoir': 7, 'canal': 9,
+    # Railways
+    'rail': 6, 'station': 10, 'halt': 12,
+    # Facilities
+    'hospital': 8, 'university': 9, 'college': 10, 'dam': 9, 'harbour': 8, 'port': 8, 'industrial': 11,
+}
+# Features without an 'fclass', or of a class not listed above
+DEFAULT_MIN_ZOOM = 10
+
+_layers = None
+
+
+# Name of the layer a file goes into, the part after '_osm_pp_', e.g. 'roads'
+def layer_name(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = re.search(r'_osm_pp_(.+)$', stem)
+    return match.group(1) if match else stem
+
+
+# The outputs of a country, with only the most detailed scale of each generalised layer
+def country_files(country_dir):
+    files = sorted(glob.glob(os.path.join(glob.escape(country_dir), '**', '*.shp'), recursive=True)
+                   + glob.glob(os.path.join(glob.escape(country_dir), '**', '*.gpkg'), recursive=True))
+    detailed = {}
+    for path in files:
+        detailed.setdefault(scale_filename(path, 's0'), path)
+    return sorted(detailed.values())
+
+
+def _properties(gdf):
+    values = gdf.drop(columns=gdf.geometry.name).astype(object)
+    values = values.where(values.notna(), None)
+    return [{k: v if isinstance(v, (str, int, float, bool)) else str(v) for k, v in row.items() if v is not None}
+            for row in values.to_dict('records')]
+
+
+# The features of a country's outputs per layer, in web mercator, with the zoom each one appears from
+def load_layers(country_dir):
+    frames = {}
+    for path in country_files(country_dir):
+        try:
+            gdf = gpd.read_file(path)
+        except Exception as e:
+            logging.error(f"Skipping {path} in the tileset: {e}")
+            continue
+        if gdf.empty or gdf.crs is None:
+            continue
+        frames.setdefault(layer_name(path), []).append(gdf.to_crs(3857))
+
+    layers = []
+    for name, parts in frames.items():
+        gdf = pd.concat(parts, ignore_index=True)
+        gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()]
+        if 'fclass' in gdf.columns:
+            min_zoom = gdf['fclass'].map(FCLASS_MIN_ZOOM).fillna(DEFAULT_MIN_ZOOM).to_numpy(dtype=int)
+        else:
+            min_zoom = np.full(len(gdf), DEFAULT_MIN_ZOOM)
+        layers.append({
+            'name': name,
+            'geometries': gdf.geometry.to_numpy(),
+            'properties': _properties(gdf),
+            'min_zoom': min_zoom,
+            'fields': {c: 'Number' if pd.api.types.is_numeric_dtype(gdf[c]) else 'String'
+                       for c in gdf.columns if c != gdf.geometry.name},
+        })
+    return layers
+
+
+def tile_bounds(z, x, y):
+    size = 2 * ORIGIN / 2 ** z
+    return -ORIGIN + x * size, ORIGIN - (y + 1) * size, -ORIGIN + (x + 1) * size, ORIGIN - y * size
+
+
+# Range of tile columns and rows at zoom 'z' covering web mercator bounds
+def tile_range(bounds, z):
+    size = 2 * ORIGIN / 2 ** z
+    minx, miny, maxx, maxy = bounds
+    last = 2 ** z - 1
+    x0, x1 = [min(max(int(math.floor((v + ORIGIN) / size)), 0), last) for v in (minx, maxx)]
+    y0, y1 = [min(max(int(math.floor((ORIGIN - v) / size)), 0), last) for v in (maxy, miny)]
+    return x0, x1, y0, y1
+
+
+def _init_worker(country_dir):
+    global _layers
+    # Each worker reads the layers itself instead of being sent a pickled copy of all of them
+    _layers = load_layers(country_dir)
+    # Spatial indexes are built in each worker, they do not pickle
+    for layer in _layers:
+        layer['tree'] = shapely.STRtree(layer['geometries'])
+
+
+# Encoded tiles of the block of tiles x0..x1, y0..y1 at zoom 'z', as (z, x, y, gzipped tile) tuples.
+# The features shown at 'z' are selected and simplified once for the whole block and then cut per tile.
+def render_block(z, x0, x1, y0, y1):
+    size = 2 * ORIGIN / 2 ** z
+    pad = size * BUFFER / EXTENT
+    block = shapely.box(-ORIGIN + x0 * size - pad, ORIGIN - (y1 + 1) * size - pad,
+                        -ORIGIN + (x1 + 1) * size + pad, ORIGIN - y0 * size + pad)
+    selected = []
+    for layer in _layers:
+        idx = layer['tree'].query(block)
+        idx = idx[layer['min_zoom'][idx] <= z]
+        if len(idx):
+            geometries = shapely.simplify(layer['geometries'][idx], size * SIMPLIFY_UNITS / EXTENT, preserve_topology=True)
+            selected.append((layer, idx, geometries, shapely.STRtree(geometries)))
+    if not selected:
+        return []
+
+    tiles = []
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            minx, miny, maxx, maxy = tile_bounds(z, x, y)
+            features = []
+            for layer, idx, geometries, tree in selected:
+                hits = tree.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))
+                clipped = shapely.clip_by_rect(geometries[hits], minx - pad, miny - pad, maxx + pad, maxy + pad)
+                layer_features = [{'geometry': geometry, 'properties': layer['properties'][idx[i]]}
+                                  for i, geometry in zip(hits, clipped) if not geometry.is_empty]
+                if layer_features:
+                    features.append({'name': layer['name'], 'features': layer_features})
+            if features:
+                data = mapbox_vector_tile.encode(features, default_options={'quantize_bounds': (minx, miny, maxx, maxy), 'extents': EXTENT})
+                tiles.append((z, x, y, gzip.compress(data)))
+    return tiles
+
+
+def _blocks(bounds, min_zoom, max_zoom):
+    for z in range(min_zoom, max_zoom + 1):
+        x0, x1, y0, y1 = tile_range(bounds, z)
+        for bx in range(x0, x1 + 1, BLOCK_SIZE):
+            for by in range(y0, y1 + 1, BLOCK_SIZE):
+                yield z, bx, min(bx + BLOCK_SIZE - 1, x1), by, min(by + BLOCK_SIZE - 1, y1)
+
+
+MBTILES_SCHEMA = """
+CREATE TABLE metadata (name TEXT, value TEXT);
+CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+def _write_metadata(db, name, layers, bounds, min_zoom, max_zoom):
+    west, south, east, north = gpd.GeoSeries([shapely.box(*bounds)], crs=3857).to_crs(4326).total_bounds
+    vector_layers = [{'id': layer['name'], 'fields': layer['fields'],
+                      'minzoom': max(min_zoom, int(layer['min_zoom'].min())), 'maxzoom': max_zoom} for layer in layers]
+    metadata = {
+        'name': name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+        'center': f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min_zoom}",
+        'json': json.dumps({'vector_layers': vector_layers}),
+    }
+    db.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)', metadata.items())
+
+
+# Write the tiles of finished block futures; returns how many were written
+def _insert_tiles(db, futures):
+    count = 0
+    for future in futures:
+        tiles = future.result()
+        # MBTiles rows count from the bottom (TMS), the tiles are addressed from the top
+        db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', [(z, x, 2 ** z - 1 - y, data) for z, x, y, data in tiles])
+        count += len(tiles)
+    return count
+
+
+# Build the tileset of one country directory. Returns the number of tiles written.
+def export_tiles(country_dir, output_path=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, workers=None):
+    if mapbox_vector_tile is None:
+        raise ImportError("Vector tile export requires mapbox-vector-tile (pip install mapbox-vector-tile)")
+    name = os.path.basename(os.path.normpath(country_dir))
+    output_path = output_path or os.path.join(country_dir, f"{name}_osm_pp_tiles.mbtiles")
+    pmtiles = output_path.endswith('.pmtiles')
+    if pmtiles and mbtiles_to_pmtiles is None:
+        raise ImportError("PMTiles output requires pmtiles (pip install pmtiles)")
+
+    layers = load_layers(country_dir)
+    if not layers:
+        logging.warning(f"No layers to export in {country_dir}")
+        return 0
+    bounds = shapely.total_bounds(np.concatenate([layer['geometries'] for layer in layers]))
+
+    # Written under a temporary name, so a viewer never opens a half-built tileset
+    mbtiles_path = f"{os.path.splitext(output_path)[0]}.{os.getpid()}.tmp.mbtiles"
+    db = sqlite3.connect(mbtiles_path)
+    count = 0
+    try:
+        db.executescript(MBTILES_SCHEMA)
+        _write_metadata(db, name, layers, bounds, min_zoom, max_zoom)
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(country_dir,)) as pool:
+            # A sliding window of submitted blocks: each finished block is written before more are submitted
+            pending = set()
+            for block in _blocks(bounds, min_zoom, max_zoom):
+                pending.add(pool.submit(render_block, *block))
+                if len(pending) >= workers * PENDING_BLOCKS_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    count += _insert_tiles(db, done)
+            count += _insert_tiles(db, pending)
+        db.commit()
+    finally:
+        db.close()
+
+    if pmtiles:
+        mbtiles_to_pmtiles(mbtiles_path, output_path, max_zoom)
+        os.remove(mbtiles_path)
+    else:
+        os.replace(mbtiles_path, output_path)
+    logging.info(f"Wrote {count} tiles of {len(layers)} layers to {output_path}")
+    return count
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export the layers of a country to one vector tileset")
+    parser.add_argument("country_dir", help=f"directory of a country's outputs, e.g. {OUTPUT_ROOT}/ken")
+    parser.add_argument("--output", help="tileset to write (.mbtiles or .pmtiles), by default <country_dir>/<cc>_osm_pp_tiles.mbtiles")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--workers", type=int, help="worker processes, by default one per CPU")
+    args = parser.parse_args()
+    export_tiles(args.country_dir, args.output, args.min_zoom, args.max_zoom, args.workers)
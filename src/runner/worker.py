@@ -0,0 +1,355 @@
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+# A long-running worker keeps osmnx, geopandas, shapely, pyproj and the layer modules imported
+# between jobs, so a (country, layer) job only pays for its own work. Jobs are exchanged through a
+# spool directory: the client drops a JSON file into 'incoming', a worker claims it by renaming it
+# into 'running' and moves it to 'done' or 'failed' with the outcome. Renames within one directory
+# tree are atomic, also on NFS, so any number of workers on any host sharing the spool can serve it.
+#
+# A claimed job is leased to its worker: the worker keeps 'running/<id>.lease' up to date while the
+# job runs. When a worker dies, its lease expires and the next worker to look requeues the job,
+# under a 'running/<id>.lock' file created exclusively so only one worker does. A worker only
+# finishes a job while it still holds its lease, so a job requeued from a slow worker is not
+# finished twice. Lease expiry uses wall clock time, so the hosts sharing a spool need synchronised clocks.
+SPOOL_DIRS = ['incoming', 'running', 'done', 'failed']
+
+# Seconds between two scans of an empty 'incoming' directory
+POLL_INTERVAL = 0.5
+
+# Seconds a lease lasts without being renewed; running workers renew theirs every third of it
+LEASE_SECONDS = 120
+
+# Claims of a job before it is failed, e.g. when it takes down every worker that runs it
+MAX_ATTEMPTS = 3
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_spool(spool_dir):
+    for name in SPOOL_DIRS:
+        os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+
+
+# Write a JSON file under a hidden name first, so a reader never sees it half-written
+def _write_json(path, data):
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Thin client: queue one (geojson file, layer) job and return its id. Only the standard library is
+# imported on this path, so submitting a job is as cheap as starting the interpreter. 'options' are
+# set on the downloader before it runs, e.g. {'dissolve': True}. Jobs are claimed in the order of
+# their ids; by default the id is the submission time.
+def submit_job(spool_dir, geojson_path, layer, options=None, job_id=None):
+    ensure_spool(spool_dir)
+    job_id = job_id or f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+    # Outputs are written relative to the submitting process's working directory, as with a direct run
+    job = {'id': job_id, 'geojson_path': os.path.abspath(geojson_path), 'layer': str(layer), 'cwd': os.getcwd()}
+    if options:
+        job['options'] = options
+    _write_json(os.path.join(spool_dir, 'incoming', f"{job_id}.json"), job)
+    return job_id
+
+
+def _job_exists(spool_dir, job_id):
+    return any(os.path.exists(os.path.join(spool_dir, state, f"{job_id}.json")) for state in SPOOL_DIRS)
+
+
+# Queue the (geojson file, layer) jobs of a multi-node run once: of all the workers started on the
+# same spool, the first to create 'seed.lock' queues them and the others wait until it is done.
+# The seeding worker touches the lock as it goes; when it dies, its lock goes stale after a lease's
+# time and a waiting worker takes over. Jobs get fixed ids from their position, so the worker taking
+# over only queues the jobs still missing. Returns True in the worker that finished queueing.
+def seed_queue(spool_dir, jobs, options=None):
+    ensure_spool(spool_dir)
+    lock_path = os.path.join(spool_dir, 'seed.lock')
+    seeded_path = os.path.join(spool_dir, 'seeded')
+    while not os.path.exists(seeded_path):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > LEASE_SECONDS:
+                    logging.warning(f"The worker queueing the jobs of {spool_dir} stopped, taking over")
+                    _remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        for index, (geojson_path, layer) in enumerate(jobs):
+            job_id = f"seed{index:08d}"
+            if not _job_exists(spool_dir, job_id):
+                submit_job(spool_dir, geojson_path, layer, options, job_id=job_id)
+            os.utime(lock_path)
+        open(seeded_path, 'w').close()
+        logging.info(f"Queued {len(jobs)} jobs in {spool_dir}")
+        return True
+    return False
+
+
+# Block until a submitted job has finished and return its final record ('status' is 'done' or 'failed')
+def wait_for_job(spool_dir, job_id, timeout=None):
+    started = time.monotonic()
+    while True:
+        for state in ['done', 'failed']:
+            path = os.path.join(spool_dir, state, f"{job_id}.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    return json.load(f)
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout} seconds")
+        time.sleep(POLL_INTERVAL)
+
+
+def renew_lease(spool_dir, job_id, worker):
+    _write_json(os.path.join(spool_dir, 'running', f"{job_id}.lease"), {'worker': worker, 'expires': time.time() + LEASE_SECONDS})
+
+
+# Claim the oldest queued job and lease it to 'worker', or return None when the queue is empty or
+# another worker was faster
+def claim_job(spool_dir, worker=None):
+    incoming = os.path.join(spool_dir, 'incoming')
+    for name in sorted(f for f in os.listdir(incoming) if f.endswith('.json')):
+        running_path = os.path.join(spool_dir, 'running', name)
+        try:
+            os.rename(os.path.join(incoming, name), running_path)
+        except FileNotFoundError:
+            continue
+        with open(running_path) as f:
+            job = json.load(f)
+        renew_lease(spool_dir, job['id'], worker or worker_id())
+        job['attempts'] = job.get('attempts', 0) + 1
+        _write_json(running_path, job)
+        return job
+    return None
+
+
+def _lease_holder(spool_dir, job_id):
+    try:
+        with open(os.path.join(spool_dir, 'running', f"{job_id}.lease")) as f:
+            return json.load(f)['worker']
+    except FileNotFoundError:
+        return None
+
+
+# Move a running job to 'done' or 'failed'. With 'worker' given, only while that worker still holds
+# the job's lease: once it expired, the job was requeued and may be running elsewhere, and its files
+# in 'running' belong to that run. Returns whether the job was finished.
+def finish_job(spool_dir, job, status, worker=None):
+    if worker is not None and _lease_holder(spool_dir, job['id']) != worker:
+        return False
+    job['status'] = status
+    _write_json(os.path.join(spool_dir, status, f"{job['id']}.json"), job)
+    _remove(os.path.join(spool_dir, 'running', f"{job['id']}.json"))
+    _remove(os.path.join(spool_dir, 'running', f"{job['id']}.lease"))
+    return True
+
+
+def _lease_expired(spool_dir, job_id):
+    try:
+        with open(os.path.join(spool_dir, 'running', f"{job_id}.lease")) as f:
+            return json.load(f)['expires'] < time.time()
+    except FileNotFoundError:
+        # Claimed but not leased yet: the claiming rename set the job file's ctime, give it a lease's time
+        try:
+            return time.time() - os.stat(os.path.join(spool_dir, 'running', f"{job_id}.json")).st_ctime > LEASE_SECONDS
+        except FileNotFoundError:
+            return False
+
+
+# Put the running jobs whose lease expired back into 'incoming', or into 'failed' after MAX_ATTEMPTS
+# claims. Returns the number of jobs requeued or failed.
+def requeue_expired(spool_dir):
+    running = os.path.join(spool_dir, 'running')
+    count = 0
+    for name in sorted(f for f in os.listdir(running) if f.endswith('.json')):
+        job_id = name[:-len('.json')]
+        if not _lease_expired(spool_dir, job_id):
+            continue
+        lock_path = os.path.join(running, f"{job_id}.lock")
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            # Left behind by a worker that died while requeueing
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > LEASE_SECONDS:
+                    _remove(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            # Checked again under the lock, another worker may have requeued the job in the meantime
+            if not _lease_expired(spool_dir, job_id):
+                continue
+            try:
+                with open(os.path.join(running, name)) as f:
+                    job = json.load(f)
+            except FileNotFoundError:
+                continue
+            if job.get('attempts', 0) >= MAX_ATTEMPTS:
+                job['error'] = f"lease expired {job['attempts']} times"
+                logging.error(f"Job {job_id} ({job['geojson_path']}, layer {job['layer']}) failed: {job['error']}")
+                finish_job(spool_dir, job, 'failed')
+            else:
+                logging.warning(f"Lease of job {job_id} expired, queueing it again")
+                os.rename(os.path.join(running, name), os.path.join(spool_dir, 'incoming', name))
+                _remove(os.path.join(running, f"{job_id}.lease"))
+            count += 1
+        finally:
+            _remove(lock_path)
+    return count
+
+
+# Renews the lease of the job a worker is running until it is stopped. Once the lease is gone or
+# held by another worker (e.g. after this one stalled past its lease), it stops renewing and sets 'lost'.
+class LeaseKeeper(threading.Thread):
+    def __init__(self, spool_dir, job_id, worker):
+        super().__init__(name='lease', daemon=True)
+        self.spool_dir = spool_dir
+        self.job_id = job_id
+        self.worker = worker
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3):
+            if _lease_holder(self.spool_dir, self.job_id) != self.worker:
+                logging.warning(f"Job {self.job_id} was requeued while it ran here")
+                self.lost = True
+                return
+            renew_lease(self.spool_dir, self.job_id, self.worker)
+
+
+# Run one job stage by stage and append it to the run history of the job's working directory
+def run_job(job):
+    # Imported here so the client side of this module stays light
+    from layer_downloader import create_downloader
+    from layers import osm_cache
+    from runner.history import RunHistory
+    from runner.outputs import output_bytes
+    from runner.scheduling import country_code
+
+    os.chdir(job['cwd'])
+    osm_cache.install()
+    history = RunHistory()
+    history.start_run(command=f"worker {os.getpid()} job {job['id']}")
+    metrics = {}
+    stage = 'fetch'
+    try:
+        downloader = create_downloader(job['geojson_path'], job['layer'])
+        for name, value in job.get('options', {}).items():
+            if hasattr(downloader, name):
+                setattr(downloader, name, value)
+        cache_before = osm_cache.stats()
+        started = time.perf_counter()
+        data = downloader.fetch_data()
+        metrics['fetch_seconds'] = time.perf_counter() - started
+        cache_after = osm_cache.stats()
+        metrics['cache_hits'] = cache_after['hits'] - cache_before['hits']
+        metrics['cache_misses'] = cache_after['misses'] - cache_before['misses']
+
+        stage = 'process'
+        started = time.perf_counter()
+        gdf = downloader.process_data(data)
+        metrics['process_seconds'] = time.perf_counter() - started
+        metrics.update(getattr(downloader, 'metrics', {}))
+        metrics['features'] = len(gdf)
+
+        stage = 'write'
+        started = time.perf_counter()
+        downloader.save_data(gdf)
+        metrics['write_seconds'] = time.perf_counter() - started
+        history.record_job(country_code(job['geojson_path']), job['layer'], metrics, output_bytes=output_bytes(downloader))
+        logging.info(f"Completed: {downloader.__class__.__name__}")
+    except Exception as e:
+        history.record_job(country_code(job['geojson_path']), job['layer'], metrics, status='failed', failed_stage=stage, error=e)
+        raise
+    finally:
+        history.close()
+
+
+# Serve jobs from the spool until interrupted; with 'max_idle' set, stop after that many idle seconds,
+# with 'drain' set, stop once no job is queued or running on any worker
+def serve(spool_dir, max_idle=None, drain=False):
+    # Jobs change the working directory, so resolve the spool once up front
+    spool_dir = os.path.abspath(spool_dir)
+    ensure_spool(spool_dir)
+    # Pay the import cost of every layer once, before the first job arrives
+    from layers import registry
+    registry.import_layers()
+
+    worker = worker_id()
+    logging.info(f"Worker {worker} serving jobs from {spool_dir}")
+    idle_since = time.monotonic()
+    while True:
+        requeue_expired(spool_dir)
+        job = claim_job(spool_dir, worker)
+        if job is None:
+            if max_idle is not None and time.monotonic() - idle_since > max_idle:
+                break
+            if drain and not any(f.endswith('.json') for f in os.listdir(os.path.join(spool_dir, 'running'))):
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        lease = LeaseKeeper(spool_dir, job['id'], worker)
+        lease.start()
+        started = time.monotonic()
+        try:
+            run_job(job)
+            status = 'done'
+        except Exception as e:
+            logging.error(f"Job {job['id']} ({job['geojson_path']}, layer {job['layer']}) failed: {e}")
+            job['error'] = str(e)
+            status = 'failed'
+        job['duration'] = time.monotonic() - started
+        # Stopped first, so the lease is not renewed after the job left 'running'
+        lease.stopped.set()
+        lease.join()
+        if lease.lost or not finish_job(spool_dir, job, status, worker):
+            logging.warning(f"Lease of job {job['id']} was lost while it ran here, leaving it to the worker that has it now")
+        idle_since = time.monotonic()
+
+
+USAGE = """python -m runner.worker serve <spool_dir>
+python -m runner.worker submit <spool_dir> <geojson_path> <layer> [--wait]"""
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('serve', 'submit'):
+        sys.exit(USAGE)
+
+    if sys.argv[1] == 'serve':
+        serve(sys.argv[2])
+    else:
+        if len(sys.argv) < 5:
+            sys.exit(USAGE)
+        job_id = submit_job(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(job_id)
+        if '--wait' in sys.argv[5:]:
+            result = wait_for_job(sys.argv[2], job_id)
+            if result['status'] != 'done':
+                sys.exit(f"Job {job_id} failed: {result.get('error')}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts run from 'src' and import their modules from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
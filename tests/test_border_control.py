@@ -0,0 +1,22 @@
+import json
+
+import shapely
+
+from layers import fetch
+from layers.border_control_sub18_class import OSMBorderControlDataDownloader
+
+
+def test_crossings_across_the_border_are_left_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    feature = {'type': 'Feature', 'properties': {}, 'geometry': shapely.geometry.mapping(shapely.box(10.0, 50.0, 10.5, 50.5))}
+    with open(tmp_path / 'abc.json', 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': [feature]}, f)
+    # About 700 m inside and outside the western border
+    monkeypatch.setattr(fetch._overpass, '_overpass_request', lambda data: {'elements': [
+        {'type': 'node', 'id': 1, 'lon': 10.01, 'lat': 50.2, 'tags': {'border': 'border_control'}},
+        {'type': 'node', 'id': 2, 'lon': 9.99, 'lat': 50.2, 'tags': {'border': 'border_control'}},
+    ]})
+
+    gdf = OSMBorderControlDataDownloader(str(tmp_path / 'abc.json'), 4326, 4326, 'abc').fetch_data()
+
+    assert list(gdf.index) == [('node', 1)]
@@ -0,0 +1,58 @@
+from runner.checkpoint import Checkpoint
+
+
+def test_completed_jobs_survive_a_restart(tmp_path):
+    output = tmp_path / 'out.shp'
+    output.write_bytes(b'roads')
+    journal = str(tmp_path / 'checkpoint.jsonl')
+    Checkpoint(journal).record(('abc', '1'), [str(output)])
+
+    checkpoint = Checkpoint(journal)
+
+    assert checkpoint.completed(('abc', '1'))
+    assert not checkpoint.completed(('abc', '2'))
+
+
+def test_changed_or_missing_outputs_run_again(tmp_path):
+    changed, removed = tmp_path / 'a.shp', tmp_path / 'b.shp'
+    changed.write_bytes(b'a')
+    removed.write_bytes(b'b')
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.jsonl'))
+    checkpoint.record(('abc', '1'), [str(changed)])
+    checkpoint.record(('abc', '2'), [str(removed)])
+    checkpoint.record(('abc', '3'), [])
+
+    changed.write_bytes(b'changed')
+    removed.unlink()
+
+    assert not checkpoint.completed(('abc', '1'))
+    assert not checkpoint.completed(('abc', '2'))
+    # Nothing written, nothing to validate
+    assert not checkpoint.completed(('abc', '3'))
+
+
+def test_a_line_cut_short_is_ignored(tmp_path):
+    output = tmp_path / 'out.shp'
+    output.write_bytes(b'roads')
+    journal = tmp_path / 'checkpoint.jsonl'
+    Checkpoint(str(journal)).record(('abc', '1'), [str(output)])
+    with open(journal, 'a') as f:
+        f.write('{"key": ["abc", "2"], "fil')
+
+    checkpoint = Checkpoint(str(journal))
+
+    assert checkpoint.completed(('abc', '1'))
+    assert not checkpoint.completed(('abc', '2'))
+
+
+def test_clear_forgets_everything(tmp_path):
+    output = tmp_path / 'out.shp'
+    output.write_bytes(b'roads')
+    journal = str(tmp_path / 'data' / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(journal)
+    checkpoint.record(('abc', '1'), [str(output)])
+
+    checkpoint.clear()
+
+    assert not checkpoint.completed(('abc', '1'))
+    assert not Checkpoint(journal).completed(('abc', '1'))
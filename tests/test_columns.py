@@ -0,0 +1,25 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from layers.columns import to_compact, to_geodataframe
+
+
+def test_compact_round_trip_through_selections():
+    gdf = gpd.GeoDataFrame({'highway': ['primary', 'primary', 'residential'], 'name': ['A', None, 'C']},
+                           geometry=[shapely.LineString([(i, 0), (i, 1)]) for i in range(3)], crs=4326)
+
+    frame = to_compact(gdf)
+    frame = frame.iloc[[2, 0]].reset_index(drop=True)[['geometry', 'highway', 'name']]
+    result = to_geodataframe(frame, gdf.crs)
+
+    assert result.crs == gdf.crs
+    assert list(result['highway']) == ['residential', 'primary']
+    assert result.geometry.iloc[0].equals(gdf.geometry.iloc[2])
+
+
+def test_a_compact_frame_needs_its_crs():
+    frame = to_compact(gpd.GeoDataFrame({'a': ['x']}, geometry=[shapely.Point(0, 0)], crs=4326))
+
+    with pytest.raises(ValueError):
+        to_geodataframe(frame)
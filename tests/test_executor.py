@@ -0,0 +1,34 @@
+import pandas as pd
+
+from runner.executor import run_pipelined
+from runner.outputs import output_files, remove_outputs
+
+
+class FailingWriter:
+    def __init__(self, output_filename):
+        self.output_filename = output_filename
+
+    def fetch_data(self):
+        return pd.DataFrame({'a': [1]})
+
+    def process_data(self, data):
+        return data
+
+    # Like most layers, reports a failed write without raising
+    def save_data(self, gdf):
+        print("An error occurred while saving the GeoDataFrame: disk full")
+
+
+def test_a_failed_write_leaves_no_earlier_output_behind(tmp_path, monkeypatch):
+    # The pipeline installs the response cache in the working directory
+    monkeypatch.chdir(tmp_path)
+    output = tmp_path / 'abc_layer.shp'
+    for ext in ['.shp', '.dbf', '.shx']:
+        output.with_suffix(ext).write_bytes(b'earlier run')
+    downloader = FailingWriter(str(output))
+    completed = []
+
+    run_pipelined([('abc', downloader)], on_complete=lambda job, downloader, metrics: completed.append(output_files(downloader)),
+                  before_write=lambda job, downloader: remove_outputs(downloader))
+
+    assert completed == [[]]
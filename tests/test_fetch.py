@@ -0,0 +1,36 @@
+import shapely
+
+from layers import fetch
+
+
+def overpass_response(monkeypatch, elements):
+    monkeypatch.setattr(fetch._overpass, '_overpass_request', lambda data: {'elements': elements})
+
+
+# An L-shaped AOI: osmnx queries its convex hull, which covers the square's empty corner too
+L_SHAPE = shapely.union_all([shapely.box(0, 0, 10, 2), shapely.box(0, 0, 2, 10)])
+
+
+def test_fetch_centroids_keeps_only_elements_in_the_polygon(monkeypatch):
+    overpass_response(monkeypatch, [
+        {'type': 'node', 'id': 1, 'lon': 1, 'lat': 1, 'tags': {'amenity': 'school'}},
+        {'type': 'node', 'id': 2, 'lon': 8, 'lat': 8, 'tags': {'amenity': 'school'}},
+        {'type': 'way', 'id': 3, 'center': {'lon': 9, 'lat': 1}, 'tags': {'amenity': 'school'}},
+        {'type': 'way', 'id': 4, 'center': {'lon': 5, 'lat': 5}, 'tags': {'amenity': 'school'}},
+    ])
+
+    gdf = fetch.fetch_centroids(L_SHAPE, [{'amenity': 'school'}])
+
+    assert list(gdf.index) == [('node', 1), ('way', 3)]
+
+
+def test_fetch_centroids_between_islands(monkeypatch):
+    islands = shapely.MultiPolygon([shapely.box(0, 0, 1, 1), shapely.box(5, 5, 6, 6)])
+    overpass_response(monkeypatch, [
+        {'type': 'node', 'id': 1, 'lon': 5.5, 'lat': 5.5, 'tags': {'amenity': 'atm'}},
+        {'type': 'node', 'id': 2, 'lon': 3, 'lat': 3, 'tags': {'amenity': 'atm'}},
+    ])
+
+    assert list(fetch.fetch_centroids(islands, [{'amenity': 'atm'}]).index) == [('node', 1)]
+    assert list(fetch.fetch_centroids_near(islands, [{'amenity': 'atm'}], [{'natural': 'coastline'}], 100).index) == [('node', 1)]
+    assert list(fetch.fetch_centroids_in(list(islands.geoms), [{'amenity': 'atm'}]).index) == [('node', 1)]
@@ -0,0 +1,92 @@
+import geopandas as gpd
+import shapely
+
+from layers.geometry import dissolve_touching, merge_lines
+
+
+def frame(names, geometries):
+    return gpd.GeoDataFrame({'name': names}, geometry=geometries, crs=3857)
+
+
+def test_dissolve_touching_merges_chains_of_the_same_name():
+    # a-b-c touch in a chain, d touches c but has another name, e stands alone
+    gdf = frame(['Rhine', 'Rhine', 'Rhine', 'Main', 'Rhine'],
+                [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1), shapely.box(2, 0, 3, 1), shapely.box(3, 0, 4, 1),
+                 shapely.box(10, 0, 11, 1)])
+
+    result, metrics = dissolve_touching(gdf, ['name'])
+
+    assert metrics == {'dissolved_geometries': 2}
+    assert sorted(result['name']) == ['Main', 'Rhine', 'Rhine']
+    rhine = result[result['name'] == 'Rhine'].area.sort_values().tolist()
+    assert rhine == [1.0, 3.0]
+    assert list(result.columns) == list(gdf.columns)
+
+
+def test_dissolve_touching_keeps_apart_polygons():
+    gdf = frame(['a', 'a'], [shapely.box(0, 0, 1, 1), shapely.box(5, 5, 6, 6)])
+
+    result, metrics = dissolve_touching(gdf, ['name'])
+
+    assert metrics == {'dissolved_geometries': 0}
+    assert len(result) == 2
+
+
+def test_dissolve_touching_without_by_columns():
+    gdf = frame(['a', 'b'], [shapely.box(0, 0, 1, 1), shapely.box(0.5, 0, 1.5, 1)])
+
+    result, metrics = dissolve_touching(gdf, [])
+
+    assert metrics == {'dissolved_geometries': 1}
+    assert result.area.tolist() == [1.5]
+
+
+def test_merge_lines_stops_at_confluences_and_other_names():
+    gdf = frame(['a', 'a', 'a', 'a', 'b'], [
+        shapely.LineString([(0, 0), (1, 0)]),
+        shapely.LineString([(1, 0), (2, 0)]),
+        # Two more segments end at (2, 0): a confluence, where the lines stay apart
+        shapely.LineString([(2, 0), (3, 0)]),
+        shapely.LineString([(2, 0), (2, 1)]),
+        # Another name continuing the first line
+        shapely.LineString([(-1, 0), (0, 0)]),
+    ])
+
+    result, metrics = merge_lines(gdf, ['name'])
+
+    # Only the first two segments are joined
+    assert metrics == {'merged_lines': 1}
+    assert len(result) == 4
+    assert sorted(result.length.tolist()) == [1.0, 1.0, 1.0, 2.0]
+
+
+def test_merge_lines_joins_a_chain_of_one_name():
+    gdf = frame(['a', 'a', 'a', 'b'], [
+        shapely.LineString([(1, 0), (2, 0)]),
+        shapely.LineString([(0, 0), (1, 0)]),
+        shapely.LineString([(3, 0), (2, 0)]),
+        shapely.LineString([(3, 0), (4, 0)]),
+    ])
+
+    result, metrics = merge_lines(gdf, ['name'])
+
+    assert metrics == {'merged_lines': 2}
+    merged = result[result['name'] == 'a'].geometry.iloc[0]
+    assert merged.geom_type == 'LineString'
+    assert merged.length == 3.0
+
+
+def test_merge_lines_keeps_one_way_directions():
+    gdf = gpd.GeoDataFrame({'name': ['a', 'a', 'a', 'a'], 'oneway': ['yes', 'yes', 'yes', 'yes']}, geometry=[
+        shapely.LineString([(0, 0), (1, 0)]),
+        shapely.LineString([(1, 0), (2, 0)]),
+        # Head to head with the first two: cannot be driven through
+        shapely.LineString([(10, 0), (11, 0)]),
+        shapely.LineString([(12, 0), (11, 0)]),
+    ], crs=3857)
+
+    result, metrics = merge_lines(gdf, ['name'], directed='oneway')
+
+    assert metrics == {'merged_lines': 1}
+    assert shapely.LineString([(0, 0), (1, 0), (2, 0)]).equals(result.geometry.iloc[-1])
+    assert len(result) == 3
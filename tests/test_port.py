@@ -0,0 +1,66 @@
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import layer_downloader
+from layers.port_sub10_class import OSMPortDataDownloader
+from runner import splitter
+
+
+def write_aoi(path):
+    feature = {'type': 'Feature', 'properties': {}, 'geometry': shapely.geometry.mapping(shapely.box(10.0, 50.0, 10.5, 50.5))}
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': [feature]}, f)
+
+
+def test_recorded_queries_follow_the_run_options(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_aoi(tmp_path / 'abc.json')
+    jobs = [(str(tmp_path / 'abc.json'), '8')]
+
+    plain = [downloader for _, downloader in layer_downloader.iter_downloaders(jobs)]
+    filters, _ = splitter.record_queries(plain)
+    assert {'natural': 'coastline'} not in filters
+
+    near_water = [downloader for _, downloader in layer_downloader.iter_downloaders(jobs, {'near_water': 500})]
+    filters, _ = splitter.record_queries(near_water)
+    for water_filter in near_water[0].water_filters:
+        assert water_filter in filters
+    assert {'landuse': 'industrial'} in filters
+
+
+def test_process_data_without_landuse(tmp_path):
+    downloader = OSMPortDataDownloader(str(tmp_path / 'abc.json'), 3857, 4326, 'abc')
+    gdf = gpd.GeoDataFrame({'harbour': ['port'], 'name': ['Pier']}, geometry=[shapely.Point(10.1, 50.1)], crs=4326)
+    gdf.index = pd.MultiIndex.from_tuples([('node', 1)], names=['element_type', 'osmid'])
+
+    gdf = downloader.process_data(gdf)
+
+    assert list(gdf['fclass']) == [None]
+    assert list(gdf['name']) == ['Pier']
+
+
+def test_extract_source_keeps_the_features_near_water(tmp_path):
+    source = splitter.ExtractSource.__new__(splitter.ExtractSource)
+    coast = shapely.LineString([(10.0, 50.0), (10.0, 50.5)])
+    # About 350 m and 7 km east of the coastline
+    near, far = shapely.box(10.005, 50.1, 10.006, 50.101), shapely.box(10.1, 50.1, 10.101, 50.101)
+    frame = gpd.GeoDataFrame({'landuse': [None, 'industrial', 'industrial'], 'natural': ['coastline', None, None]},
+                             geometry=[coast, near, far], crs=4326)
+    frame.index = pd.MultiIndex.from_tuples([('way', 1), ('way', 2), ('way', 3)], names=['element_type', 'osmid'])
+
+    def select(polygon, matches, own_country=True):
+        tags = np.array([matches(row.dropna().to_dict()) for _, row in frame.drop(columns='geometry').iterrows()])
+        return frame[tags & frame.intersects(polygon)]
+
+    source._select = select
+    # The coastline lies about 150 m west of the query polygon, as it would across a border
+    polygon = shapely.box(10.002, 49, 11, 51)
+
+    gdf = source.fetch_centroids_near(polygon, [{'landuse': 'industrial'}], [{'natural': 'coastline'}], 1000)
+
+    assert list(gdf.index.get_level_values('osmid')) == [2]
+    assert (gdf.geom_type == 'Point').all()
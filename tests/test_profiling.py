@@ -0,0 +1,57 @@
+import pstats
+import threading
+
+import pytest
+
+from runner import profiling
+
+
+def first_job_work():
+    return sum(range(10000))
+
+
+def second_job_work():
+    return sum(range(10000))
+
+
+class Stages:
+    def __init__(self, work, started, other_started):
+        self.work = work
+        self.started = started
+        self.other_started = other_started
+
+    def fetch_data(self):
+        self.started.set()
+        # Only goes on while the other job's stage runs too
+        assert self.other_started.wait(5)
+        return self.work()
+
+    def process_data(self, data):
+        return data
+
+    def save_data(self, gdf):
+        pass
+
+
+def profiled_functions(profiler):
+    return {name for _, _, name in pstats.Stats(profiler.profile).stats}
+
+
+@pytest.mark.skipif(not profiling.CONCURRENT_PROFILES, reason='cProfile allows one profiler per process')
+def test_stages_of_two_jobs_are_profiled_side_by_side(tmp_path):
+    first, second = threading.Event(), threading.Event()
+    profilers = [profiling.JobProfiler('abc', layer, str(tmp_path)) for layer in ['1', '2']]
+    jobs = [profilers[0].attach(Stages(first_job_work, first, second)),
+            profilers[1].attach(Stages(second_job_work, second, first))]
+
+    threads = [threading.Thread(target=job.fetch_data) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert first.is_set() and second.is_set()
+    assert 'first_job_work' in profiled_functions(profilers[0])
+    assert 'second_job_work' not in profiled_functions(profilers[0])
+    assert 'second_job_work' in profiled_functions(profilers[1])
+    assert 'Warning' not in profiling.summarize([profiler.dump() for profiler in profilers])
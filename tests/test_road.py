@@ -0,0 +1,63 @@
+import json
+
+import geopandas as gpd
+import osmnx as ox
+import pandas as pd
+import shapely
+
+from layers import road_sub1_class
+from layers.road_sub1_class import OSMRoadDataDownloader
+
+
+def edges(rows):
+    index = pd.MultiIndex.from_tuples([row[:3] for row in rows], names=['u', 'v', 'key'])
+    return gpd.GeoDataFrame({'osmid': [row[3] for row in rows], 'length': [row[4] for row in rows]},
+                            geometry=[shapely.LineString([(0, 0), (1, 1)])] * len(rows), index=index, crs=4326)
+
+
+def test_collapse_reverse_edges_keeps_one_edge_per_two_way_street(tmp_path):
+    downloader = OSMRoadDataDownloader(str(tmp_path / 'abc.json'), 'abc')
+    gdf = edges([
+        (1, 2, 0, 10, 100.0),
+        (2, 1, 0, 10, 100.0),
+        # A simplified edge lists its ways in the direction it runs; its length sums in another order
+        (3, 4, 0, [11, 12], 250.004),
+        (4, 3, 0, [12, 11], 250.001),
+        # A parallel edge between the same nodes along another way
+        (1, 2, 1, 13, 120.0),
+        # One-way
+        (5, 6, 0, 14, 80.0),
+    ])
+
+    result = downloader.collapse_reverse_edges(gdf)
+
+    assert list(result.index) == [(1, 2, 0), (3, 4, 0), (1, 2, 1), (5, 6, 0)]
+
+
+def test_collapse_reverse_edges_needs_the_graph_columns(tmp_path):
+    downloader = OSMRoadDataDownloader(str(tmp_path / 'abc.json'), 'abc')
+    gdf = edges([(1, 2, 0, 10, 100.0), (2, 1, 0, 10, 100.0)]).drop(columns='length')
+
+    assert len(downloader.collapse_reverse_edges(gdf)) == 2
+
+
+def test_the_way_tags_are_only_narrowed_for_the_graph_fetch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    default = list(ox.settings.useful_tags_way)
+    feature = {'type': 'Feature', 'properties': {}, 'geometry': shapely.geometry.mapping(shapely.box(10.0, 50.0, 10.5, 50.5))}
+    with open(tmp_path / 'abc.json', 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': [feature]}, f)
+    seen = []
+
+    def edges_from_polygon(polygon, network_type):
+        seen.append(list(ox.settings.useful_tags_way))
+        return edges([(1, 2, 0, 10, 100.0)]).assign(highway='primary')
+
+    monkeypatch.setattr(road_sub1_class, 'edges_from_polygon', edges_from_polygon)
+    downloader = OSMRoadDataDownloader(str(tmp_path / 'abc.json'), 'abc')
+    assert ox.settings.useful_tags_way == default
+
+    downloader.fetch_data()
+
+    assert seen == [['highway', 'junction'] + OSMRoadDataDownloader.osm_required_tags]
+    assert ox.settings.useful_tags_way == default
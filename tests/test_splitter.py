@@ -0,0 +1,21 @@
+from runner.splitter import filter_predicate
+
+
+def test_filter_predicate_needs_every_tag_of_a_filter():
+    matches = filter_predicate([{'amenity': 'atm'}, {'amenity': 'bank', 'atm': 'yes'}])
+
+    assert matches({'amenity': 'atm'})
+    assert matches({'amenity': 'bank', 'atm': 'yes', 'name': 'B'})
+    assert not matches({'amenity': 'bank'})
+    assert not matches({'amenity': 'bank', 'atm': 'no'})
+    assert not matches({'name': 'atm'})
+
+
+def test_filter_predicate_value_kinds():
+    matches = filter_predicate([{'waterway': ['river', 'canal']}, {'natural': 'coastline'}, {'CEMT': True}])
+
+    assert matches({'waterway': 'canal'})
+    assert not matches({'waterway': 'stream'})
+    assert matches({'natural': 'coastline'})
+    assert matches({'CEMT': 'IV'})
+    assert not matches({})
@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from layers import registry
+from runner import worker
+
+
+@pytest.fixture
+def fast_leases(monkeypatch):
+    monkeypatch.setattr(worker, 'LEASE_SECONDS', 1.0)
+    monkeypatch.setattr(worker, 'POLL_INTERVAL', 0.02)
+
+
+def listing(spool_dir, state):
+    return sorted(f for f in os.listdir(os.path.join(spool_dir, state)) if f.endswith('.json'))
+
+
+def test_claim_job_takes_the_oldest_job_and_leases_it(tmp_path):
+    spool = str(tmp_path)
+    first = worker.submit_job(spool, 'a.json', '1', job_id='seed00000000')
+    worker.submit_job(spool, 'b.json', '1', job_id='seed00000001')
+
+    job = worker.claim_job(spool, 'w1')
+
+    assert job['id'] == first
+    assert job['attempts'] == 1
+    assert listing(spool, 'running') == [f"{first}.json"]
+    with open(os.path.join(spool, 'running', f"{first}.lease")) as f:
+        assert json.load(f)['worker'] == 'w1'
+
+
+def test_claim_job_returns_none_on_an_empty_queue(tmp_path):
+    worker.ensure_spool(str(tmp_path))
+    assert worker.claim_job(str(tmp_path), 'w1') is None
+
+
+def test_requeue_expired_requeues_then_fails(tmp_path, fast_leases, monkeypatch):
+    spool = str(tmp_path)
+    monkeypatch.setattr(worker, 'MAX_ATTEMPTS', 2)
+    job_id = worker.submit_job(spool, 'a.json', '1')
+
+    worker.claim_job(spool, 'w1')
+    assert worker.requeue_expired(spool) == 0
+    time.sleep(1.1)
+    assert worker.requeue_expired(spool) == 1
+    assert listing(spool, 'incoming') == [f"{job_id}.json"]
+
+    assert worker.claim_job(spool, 'w2')['attempts'] == 2
+    time.sleep(1.1)
+    assert worker.requeue_expired(spool) == 1
+    assert listing(spool, 'failed') == [f"{job_id}.json"]
+    assert os.listdir(os.path.join(spool, 'running')) == []
+
+
+def test_finish_job_needs_the_lease(tmp_path, fast_leases):
+    spool = str(tmp_path)
+    worker.submit_job(spool, 'a.json', '1')
+    slow = worker.claim_job(spool, 'w1')
+    time.sleep(1.1)
+    worker.requeue_expired(spool)
+    worker.claim_job(spool, 'w2')
+
+    # The first worker finishes after its lease expired and the job was claimed again
+    assert not worker.finish_job(spool, slow, 'done', 'w1')
+    assert listing(spool, 'done') == []
+    assert listing(spool, 'running') == [f"{slow['id']}.json"]
+
+
+def test_seed_queue_takes_over_a_stale_lock(tmp_path, fast_leases):
+    spool = str(tmp_path)
+    jobs = [('a.json', '1'), ('b.json', '1'), ('c.json', '1')]
+    # A worker died after queueing the first job
+    worker.submit_job(spool, *jobs[0], job_id='seed00000000')
+    lock_path = os.path.join(spool, 'seed.lock')
+    open(lock_path, 'w').close()
+    os.utime(lock_path, (time.time() - 2, time.time() - 2))
+
+    assert worker.seed_queue(spool, jobs)
+    assert listing(spool, 'incoming') == ['seed00000000.json', 'seed00000001.json', 'seed00000002.json']
+    assert not worker.seed_queue(spool, jobs)
+
+
+def _fake_run_job(job):
+    with open(os.path.join(os.path.dirname(job['cwd']), 'runs'), 'a') as f:
+        f.write(f"{job['geojson_path']}\n")
+    if job['geojson_path'].endswith('crash.json') and job['attempts'] == 1:
+        # The worker dies holding the job
+        os._exit(1)
+    if job['geojson_path'].endswith('bad.json'):
+        raise RuntimeError('bad job')
+    time.sleep(0.02)
+
+
+def _node(spool_dir, jobs):
+    worker.run_job = _fake_run_job
+    registry.import_layers = lambda: None
+    worker.seed_queue(spool_dir, jobs)
+    worker.serve(spool_dir, drain=True)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_workers_share_a_queue(tmp_path, fast_leases, monkeypatch):
+    spool = str(tmp_path / 'spool')
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    jobs = [(f"/data/{i}.json", '1') for i in range(20)] + [('/data/crash.json', '1'), ('/data/bad.json', '1')]
+
+    monkeypatch.chdir(work_dir)
+    context = multiprocessing.get_context('fork')
+    nodes = [context.Process(target=_node, args=(spool, jobs)) for _ in range(4)]
+    for node in nodes:
+        node.start()
+    for node in nodes:
+        node.join(timeout=60)
+
+    assert len(listing(spool, 'done')) == len(jobs) - 1
+    assert len(listing(spool, 'failed')) == 1
+    assert listing(spool, 'incoming') == listing(spool, 'running') == []
+    with open(tmp_path / 'runs') as f:
+        runs = f.read().split()
+    assert runs.count('/data/crash.json') == 2
+    assert sorted(set(runs)) == sorted(job[0] for job in jobs)
+
+
+def test_a_stalled_worker_does_not_take_the_lease_back(tmp_path, fast_leases):
+    spool = str(tmp_path)
+    worker.submit_job(spool, 'a.json', '1')
+    stalled = worker.claim_job(spool, 'w1')
+    time.sleep(1.1)
+    worker.requeue_expired(spool)
+    current = worker.claim_job(spool, 'w2')
+
+    # The first worker resumes with its lease keeper still running
+    lease = worker.LeaseKeeper(spool, stalled['id'], 'w1')
+    lease.start()
+    time.sleep(0.5)
+    lease.stopped.set()
+    lease.join()
+
+    assert lease.lost
+    assert worker._lease_holder(spool, stalled['id']) == 'w2'
+    assert not worker.finish_job(spool, stalled, 'done', 'w1')
+    assert worker.finish_job(spool, current, 'done', 'w2')
+    assert listing(spool, 'done') == [f"{current['id']}.json"]
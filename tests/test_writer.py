@@ -0,0 +1,19 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from layers.writer import DRIVERS, iter_chunks, write_chunks
+
+
+@pytest.mark.parametrize('extension', sorted(DRIVERS))
+def test_chunks_are_written_to_one_file(tmp_path, extension):
+    gdf = gpd.GeoDataFrame({'name': [f"road {i}" for i in range(25)]},
+                           geometry=[shapely.LineString([(i, 0), (i, 1)]) for i in range(25)], crs=4326)
+    output = str(tmp_path / 'out' / f"roads{extension}")
+
+    written = write_chunks(iter_chunks(gdf, chunk_size=10), output)
+
+    assert written == 25
+    result = gpd.read_file(output)
+    assert list(result['name']) == list(gdf['name'])
+    assert result.geometry.equals(gdf.geometry)